@@ -0,0 +1,151 @@
+# app/acs_client.py
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .config import settings
+
+# کدهای وضعیتی که نشانه‌ی خرابی موقت سرور هستند و ارزش تلاش مجدد دارند
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+class CircuitOpenError(httpx.RequestError):
+    """ مدار باز است و درخواست بدون تماس با ACS رد می‌شود (مانند خطای اتصال رفتار می‌کند). """
+
+
+class CircuitBreaker:
+    """
+    پس از failure_threshold خطای پشت سر هم مدار باز می‌شود و تا reset_timeout ثانیه
+    درخواست‌ها فوراً رد می‌شوند. سپس یک درخواست آزمایشی (half-open) اجازه می‌یابد؛
+    موفقیت آن مدار را می‌بندد و شکستش دوباره آن را باز می‌کند.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """ درخواست آزمایشی بدون نتیجه (مثلاً لغو شده) تمام شد؛ درخواست بعدی می‌تواند آزمایشی باشد. """
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+class AcsClient:
+    """
+    کلاینت مدیریت‌شده‌ی HTTP برای GenieACS با محدودیت استخر اتصال و keep-alive قابل تنظیم،
+    تلاش مجدد با backoff تصادفی برای GETها و circuit breaker برای رد سریع درخواست‌ها
+    هنگامی که ACS در دسترس نیست.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.ACS_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.ACS_BREAKER_RESET_TIMEOUT,
+        )
+
+    def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.ACS_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.ACS_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.ACS_KEEPALIVE_EXPIRY,
+                ),
+            )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # اگر خارج از چرخه‌ی عمر برنامه (مثلاً در اسکریپت‌ها) استفاده شود، کلاینت ساخته می‌شود
+        if self._client is None:
+            self.start()
+        return self._client
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"GenieACS circuit is open; not calling {url}")
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.RequestError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # لغو (CancelledError) یا خطای غیرشبکه‌ای نشانه‌ی خرابی ACS نیست،
+            # اما درخواست آزمایشی نباید برای همیشه در حال اجرا باقی بماند
+            self.breaker.release_probe()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        """ GET با تلاش مجدد (full jitter) برای خطاهای اتصال و 502/503/504. """
+        attempts = max(1, settings.ACS_RETRY_ATTEMPTS)
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                response = await self._send("GET", url, **kwargs)
+            except CircuitOpenError:
+                raise
+            except httpx.RequestError:
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS or last_attempt:
+                    return response
+            await asyncio.sleep(random.uniform(0, settings.ACS_RETRY_BACKOFF * (2 ** attempt)))
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self._send("POST", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self._send("DELETE", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"circuit": self.breaker.stats(), "started": self._client is not None}
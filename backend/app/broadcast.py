@@ -0,0 +1,125 @@
+# app/broadcast.py
+# backendهای انتشار پیام WebSocket بین workerهای مختلف uvicorn
+
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# تابعی که پیام را به سوکت‌های محلی همین worker تحویل می‌دهد: deliver(device_id, message)
+DeliverFn = Callable[[str, str], None]
+
+
+class BroadcastBackend(ABC):
+    """ رابط backend انتشار؛ publish پیام را به همه‌ی workerها (از جمله همین worker) می‌رساند. """
+
+    @abstractmethod
+    async def start(self, deliver: DeliverFn) -> None:
+        ...
+
+    @abstractmethod
+    async def publish(self, device_id: str, message: str) -> None:
+        ...
+
+    async def stop(self) -> None:
+        pass
+
+
+class InMemoryBroadcastBackend(BroadcastBackend):
+    """ backend پیش‌فرض برای اجرای تک worker: پیام مستقیماً به سوکت‌های محلی تحویل داده می‌شود. """
+
+    def __init__(self):
+        self._deliver: Optional[DeliverFn] = None
+
+    async def start(self, deliver: DeliverFn) -> None:
+        self._deliver = deliver
+
+    async def publish(self, device_id: str, message: str) -> None:
+        if self._deliver:
+            self._deliver(device_id, message)
+
+
+class PostgresBroadcastBackend(BroadcastBackend):
+    """
+    انتشار با LISTEN/NOTIFY پستگرس روی همان پایگاه داده‌ی برنامه.
+    هر worker روی کانال LISTEN می‌کند و هر NOTIFY (حتی از خودش) را به سوکت‌های محلی‌اش می‌رساند.
+    """
+
+    def __init__(self, dsn: str, channel: str):
+        self.dsn = dsn
+        self.channel = channel
+        self._deliver: Optional[DeliverFn] = None
+        self._listen_conn = None
+        self._pool = None
+
+    async def start(self, deliver: DeliverFn) -> None:
+        import asyncpg
+
+        self._deliver = deliver
+        self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=2)
+        await self._listen()
+
+    async def _listen(self) -> None:
+        import asyncpg
+
+        self._listen_conn = await asyncpg.connect(self.dsn)
+        await self._listen_conn.add_listener(self.channel, self._on_notify)
+        self._listen_conn.add_termination_listener(self._on_terminated)
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            data = json.loads(payload)
+            device_id, message = data["device_id"], data["message"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed broadcast payload on %s: %.200s", channel, payload)
+            return
+        if self._deliver:
+            self._deliver(device_id, message)
+
+    def _on_terminated(self, connection) -> None:
+        # اتصال LISTEN قطع شده؛ در پس‌زمینه دوباره وصل می‌شویم
+        if self._deliver is not None:
+            asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = 1.0
+        while self._deliver is not None:
+            try:
+                await self._listen()
+                return
+            except Exception:
+                logger.exception("Could not re-establish LISTEN on %s, retrying in %.0fs", self.channel, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def publish(self, device_id: str, message: str) -> None:
+        payload = json.dumps({"device_id": device_id, "message": message})
+        try:
+            await self._pool.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+        except Exception:
+            # اگر پستگرس در دسترس نبود، حداقل کلاینت‌های همین worker پیام را بگیرند
+            logger.exception("pg_notify failed; delivering to local sockets only")
+            if self._deliver:
+                self._deliver(device_id, message)
+
+    async def stop(self) -> None:
+        self._deliver = None
+        if self._listen_conn is not None:
+            await self._listen_conn.close()
+            self._listen_conn = None
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+
+def create_broadcast_backend() -> BroadcastBackend:
+    """ backend را بر اساس WS_BROADCAST_BACKEND در تنظیمات می‌سازد. """
+    if settings.WS_BROADCAST_BACKEND == "postgres":
+        from .database import DATABASE_URL
+        return PostgresBroadcastBackend(DATABASE_URL, settings.WS_BROADCAST_CHANNEL)
+    return InMemoryBroadcastBackend()
@@ -0,0 +1,158 @@
+# app/cache.py
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from .config import settings
+
+
+class TTLCache:
+    """
+    کش درون‌پردازه‌ای با اندازه‌ی محدود و حذف LRU.
+    تا ttl ثانیه مقدار تازه است؛ پس از آن تا stale_ttl ثانیه‌ی دیگر مقدار کهنه
+    برگردانده می‌شود و هم‌زمان یک بارگذاری مجدد در پس‌زمینه اجرا می‌شود.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, stale_ttl: float = 0.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # ساختار: { key: (value, stored_at) } به ترتیب آخرین استفاده
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        # بارگذاری‌های در جریان، تا چند درخواست هم‌زمان فقط یک بار به ACS بروند.
+        # invalidate و clear ورودی را جدا می‌کنند تا درخواست بعدی بارگذاری تازه‌ای شروع کند
+        # و بارگذاری قدیمی (که دیگر ورودی خودش را ندارد) نتیجه‌اش را ذخیره نکند
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # روت‌های sync (مثلاً عملیات ادمین در crud.py) از threadpool کش را پاک می‌کنند؛
+        # هر دسترسی به ساختارها کوتاه و بدون await است، پس یک قفل ساده کافی است
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """ مقدار تازه‌ی یک کلید را بدون بارگذاری برمی‌گرداند. """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or time.monotonic() - entry[1] >= self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._data.pop(key, None)
+
+    def invalidate_matching(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """ تمام ورودی‌هایی که predicate(key, value) برایشان True است را حذف می‌کند. """
+        with self._lock:
+            stale_keys = [key for key, (value, _) in self._data.items() if predicate(key, value)]
+            for key in stale_keys:
+                del self._data[key]
+            # مقدار بارگذاری‌های در جریان هنوز معلوم نیست، پس همه‌ی آن‌ها جدا می‌شوند
+            self._inflight.clear()
+            return len(stale_keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._inflight.clear()
+            self._data.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        مقدار کش‌شده را برمی‌گرداند یا آن را با loader بارگذاری می‌کند.
+        مقدار کهنه فوراً برگردانده می‌شود و تازه‌سازی در پس‌زمینه انجام می‌شود.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = time.monotonic() - stored_at
+                if age < self.ttl:
+                    self.hits += 1
+                    self._data.move_to_end(key)
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self.stale_hits += 1
+                    self._data.move_to_end(key)
+                    self._load(key, loader)
+                    return value
+            self.misses += 1
+        # shield باعث می‌شود لغو یک درخواست، بارگذاری مشترک بقیه را لغو نکند
+        return await asyncio.shield(self._load(key, loader))
+
+    def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = asyncio.ensure_future(self._run(key, loader))
+                # خطای تازه‌سازی پس‌زمینه نباید به صورت «exception never retrieved» گزارش شود
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                self._inflight[key] = future
+            return future
+
+    async def _run(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        me = asyncio.current_task()
+        try:
+            value = await loader()
+            with self._lock:
+                # اگر در این فاصله invalidate یا clear شده باشد، ورودی دیگر مال این بارگذاری نیست
+                if self._inflight.get(key) is me:
+                    self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is me:
+                    del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# کش کاربر احراز هویت شده؛ کلید: (username, iat توکن)، مقدار: schemas.User (نه شیء ORM)
+principal_cache = TTLCache(
+    "principal",
+    maxsize=settings.PRINCIPAL_CACHE_MAX_ENTRIES,
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+)
+
+
+def invalidate_principal(user_id: int) -> None:
+    """ کاربر را از کش حذف می‌کند تا تغییر دسترسی یا رمز فوراً اعمال شود. """
+    principal_cache.invalidate_matching(lambda key, user: user is not None and user.id == user_id)
+
+
+# توکن‌های JWT تأیید شده؛ کلید: sha256 توکن، مقدار: claims. انقضا با exp خود توکن بررسی می‌شود
+token_cache = TTLCache(
+    "token",
+    maxsize=settings.TOKEN_CACHE_MAX_ENTRIES,
+    ttl=float("inf"),
+)
@@ -1,7 +1,14 @@
 # app/crud.py
 
+import base64
+import binascii
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session, selectinload
 from . import models, schemas, security
+from .cache import invalidate_principal
 from sqlalchemy.orm import joinedload
 
 # --- User CRUD Operations ---
@@ -68,6 +75,7 @@ def assign_permission_to_user(db: Session, user_id: int, permission_id: int):
     if user and permission and permission not in user.permissions:
         user.permissions.append(permission)
         db.commit()
+        invalidate_principal(user_id)
         db.refresh(user)
     return user
 
@@ -80,6 +88,7 @@ def remove_permission_from_user(db: Session, user_id: int, permission_id: int):
     if user and permission and permission in user.permissions:
         user.permissions.remove(permission)
         db.commit()
+        invalidate_principal(user_id)
         db.refresh(user)
     return user
 
@@ -92,6 +101,7 @@ def delete_user(db: Session, user_id: int):
             return None # یا یک خطای خاص برگردانید
         db.delete(user)
         db.commit()
+        invalidate_principal(user_id)
         return True # نشانه‌ی موفقیت
     return False # کاربر پیدا نشد
 
@@ -101,6 +111,7 @@ def update_user_password(db: Session, user_id: int, new_password: str):
     if user:
         user.hashed_password = security.get_password_hash(new_password)
         db.commit()
+        invalidate_principal(user_id)
         db.refresh(user)
         return user
     return None
@@ -112,6 +123,7 @@ def create_task_log(db: Session, task: schemas.TaskLogCreate):
         task_name=task.task_name,
         status=task.status,
         payload=task.payload,
+        genieacs_task_id=task.genieacs_task_id,
         created_by_user_id=task.created_by_user_id
     )
     db.add(db_log)
@@ -119,14 +131,65 @@ def create_task_log(db: Session, task: schemas.TaskLogCreate):
     db.refresh(db_log)
     return db_log
 
-def get_task_logs_for_device(db: Session, device_id: str, limit: int = 20):
-    """ آخرین لاگ‌های تسک برای یک دستگاه خاص را برمی‌گرداند. """
-    return db.query(models.TaskLog)\
-        .filter(models.TaskLog.device_id == device_id)\
-        .options(joinedload(models.TaskLog.created_by))\
-        .order_by(models.TaskLog.created_at.desc())\
-        .limit(limit)\
+def encode_task_cursor(task_log: models.TaskLog) -> str:
+    """ cursor صفحه‌ی بعد را از (created_at, id) آخرین ردیف می‌سازد. """
+    raw = f"{task_log.created_at.isoformat()}|{task_log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_task_cursor(cursor: str) -> Tuple[datetime, int]:
+    """ cursor را به (created_at, id) تبدیل می‌کند؛ در صورت نامعتبر بودن ValueError می‌دهد. """
+    try:
+        created_at, task_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(task_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+def _paginate_task_logs(query, cursor: Optional[str], limit: int):
+    """
+    صفحه‌بندی keyset روی (created_at, id) به ترتیب نزولی، بدون OFFSET.
+    یک ردیف اضافه خوانده می‌شود تا وجود صفحه‌ی بعد مشخص شود.
+    """
+    if cursor:
+        created_at, task_id = decode_task_cursor(cursor)
+        query = query.filter(tuple_(models.TaskLog.created_at, models.TaskLog.id) < tuple_(created_at, task_id))
+    rows = query.options(joinedload(models.TaskLog.created_by))\
+        .order_by(models.TaskLog.created_at.desc(), models.TaskLog.id.desc())\
+        .limit(limit + 1)\
         .all()
+    next_cursor = encode_task_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def get_task_logs_for_device(db: Session, device_id: str, limit: int = 20, cursor: Optional[str] = None):
+    """ لاگ‌های تسک یک دستگاه را از جدید به قدیم، صفحه به صفحه برمی‌گرداند: (لیست، cursor بعدی). """
+    query = db.query(models.TaskLog).filter(models.TaskLog.device_id == device_id)
+    return _paginate_task_logs(query, cursor, limit)
+
+def search_task_logs(
+    db: Session,
+    status: Optional[str] = None,
+    task_name: Optional[str] = None,
+    user_id: Optional[int] = None,
+    device_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+):
+    """ جستجو در لاگ‌های تسک تمام دستگاه‌ها با فیلترهای اختیاری: (لیست، cursor بعدی). """
+    query = db.query(models.TaskLog)
+    if status:
+        query = query.filter(models.TaskLog.status == status)
+    if task_name:
+        query = query.filter(models.TaskLog.task_name == task_name)
+    if user_id is not None:
+        query = query.filter(models.TaskLog.created_by_user_id == user_id)
+    if device_id:
+        query = query.filter(models.TaskLog.device_id == device_id)
+    if since:
+        query = query.filter(models.TaskLog.created_at >= since)
+    if until:
+        query = query.filter(models.TaskLog.created_at < until)
+    return _paginate_task_logs(query, cursor, limit)
 
 def get_task_log_by_id(db: Session, task_log_id: int):
     """
@@ -145,13 +208,3 @@ def delete_task_log(db: Session, task_log_id: int) -> bool:
         db.commit()
         return True
     return False
-
-def check_pending_task_exists(db: Session, device_id: str, task_name: str) -> bool:
-    """
-    چک می‌کند آیا تسک مشابهی با وضعیت 'در انتظار' برای دستگاه وجود دارد یا خیر.
-    """
-    return db.query(models.TaskLog)\
-        .filter(models.TaskLog.device_id == device_id)\
-        .filter(models.TaskLog.task_name == task_name)\
-        .filter(models.TaskLog.status == 'sent_to_genieacs')\
-        .first() is not None
\ No newline at end of file
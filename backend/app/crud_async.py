@@ -0,0 +1,233 @@
+# app/crud_async.py
+# توابع async پایگاه داده برای روت‌ها و کارهای پس‌زمینه‌ی async (با AsyncSession)؛
+# عملیات مدیریت کاربران و تاریخچه‌ی تسک‌ها فقط در crud.py (روت‌های sync) پیاده شده‌اند
+
+import random
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, distinct, func, insert, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from . import models, schemas
+
+# --- User CRUD Operations ---
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    """ یک کاربر را با نام کاربری همراه با دسترسی‌هایش می‌خواند. """
+    result = await db.execute(
+        select(models.User).options(
+            selectinload(models.User.permissions)
+        ).filter(models.User.username == username)
+    )
+    return result.scalars().first()
+
+# --- TaskLog CRUD Operations ---
+
+async def create_task_log(db: AsyncSession, task: schemas.TaskLogCreate):
+    """ یک لاگ عملیات جدید در دیتابیس ایجاد می‌کند. """
+    db_log = models.TaskLog(
+        device_id=task.device_id,
+        task_name=task.task_name,
+        status=task.status,
+        payload=task.payload,
+        genieacs_task_id=task.genieacs_task_id,
+        created_by_user_id=task.created_by_user_id
+    )
+    db.add(db_log)
+    await db.commit()
+    await db.refresh(db_log)
+    return db_log
+
+async def bulk_create_task_logs(db: AsyncSession, tasks: List[schemas.TaskLogCreate]) -> None:
+    """ چندین لاگ تسک را با یک INSERT چندسطری و یک commit ثبت می‌کند. """
+    if not tasks:
+        return
+    await db.execute(insert(models.TaskLog), [task.model_dump() for task in tasks])
+    await db.commit()
+
+async def get_task_log_by_id(db: AsyncSession, task_log_id: int):
+    """ یک لاگ تسک را با استفاده از ID آن از پایگاه داده می‌خواند. """
+    return await db.get(models.TaskLog, task_log_id)
+
+async def delete_task_log(db: AsyncSession, task_log_id: int) -> bool:
+    """ یک لاگ تسک را با استفاده از ID آن از پایگاه داده حذف می‌کند. """
+    task_to_delete = await db.get(models.TaskLog, task_log_id)
+    if task_to_delete:
+        await db.delete(task_to_delete)
+        await db.commit()
+        return True
+    return False
+
+async def acquire_pending_task_guards(db: AsyncSession, device_ids: List[str], task_name: str,
+                                     ttl: float) -> Set[str]:
+    """
+    برای هر دستگاه قفل «تسک در انتظار» با این نام را با یک INSERT ... ON CONFLICT می‌گیرد و
+    دستگاه‌هایی را که قفلشان گرفته شد برمی‌گرداند (بقیه تسک در انتظار دارند).
+    قفل‌های قدیمی‌تر از ttl ثانیه (وب‌هوکی که هرگز نرسید) دوباره گرفته می‌شوند.
+    بررسی و ثبت در یک دستور انجام می‌شود، پس دو درخواست هم‌زمان نمی‌توانند هر دو موفق شوند.
+    """
+    if not device_ids:
+        return set()
+    stmt = pg_insert(models.PendingTaskGuard).values(
+        [{"device_id": device_id, "task_name": task_name} for device_id in device_ids]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.PendingTaskGuard.device_id, models.PendingTaskGuard.task_name],
+        set_={"created_at": func.now()},
+        where=models.PendingTaskGuard.created_at < func.now() - timedelta(seconds=ttl),
+    ).returning(models.PendingTaskGuard.device_id)
+    result = await db.execute(stmt)
+    acquired = set(result.scalars().all())
+    await db.commit()
+    return acquired
+
+async def release_pending_task_guards(db: AsyncSession, pairs: List[Tuple[str, str]]) -> None:
+    """ قفل‌های (device_id, task_name) را آزاد می‌کند؛ commit با فراخواننده است. """
+    if not pairs:
+        return
+    await db.execute(
+        delete(models.PendingTaskGuard).where(
+            tuple_(models.PendingTaskGuard.device_id, models.PendingTaskGuard.task_name).in_(pairs)
+        )
+    )
+
+async def get_pending_task_logs_for_devices(db: AsyncSession, device_ids: List[str]) -> Dict[str, List[models.TaskLog]]:
+    """ تسک‌های «در انتظار» چند دستگاه را در یک کوئری، از جدیدترین به قدیمی‌ترین، برمی‌گرداند. """
+    result = await db.execute(
+        select(models.TaskLog)
+        .filter(models.TaskLog.device_id.in_(device_ids))
+        .filter(models.TaskLog.status == 'sent_to_genieacs')
+        .order_by(models.TaskLog.created_at.desc())
+    )
+    pending: Dict[str, List[models.TaskLog]] = {}
+    for task_log in result.scalars().all():
+        pending.setdefault(task_log.device_id, []).append(task_log)
+    return pending
+
+async def get_pending_task_logs_by_genieacs_ids(db: AsyncSession, genieacs_task_ids: List[str]) -> Dict[str, models.TaskLog]:
+    """ لاگ تسک‌های «در انتظار» را با شناسه‌ی تسک GenieACS (ستون ایندکس‌دار) پیدا می‌کند. """
+    result = await db.execute(
+        select(models.TaskLog)
+        .filter(models.TaskLog.genieacs_task_id.in_(genieacs_task_ids))
+        .filter(models.TaskLog.status == 'sent_to_genieacs')
+    )
+    return {task_log.genieacs_task_id: task_log for task_log in result.scalars().all()}
+
+async def bulk_update_task_statuses(db: AsyncSession, updates: List[Dict[str, Any]]) -> None:
+    """
+    وضعیت چند لاگ تسک را با UPDATE گروهی بر اساس کلید اصلی ثبت می‌کند.
+    هر عضو updates شامل id و فیلدهای جدید (status و در صورت نیاز response) است.
+    """
+    if not updates:
+        return
+    await db.execute(update(models.TaskLog), updates)
+    await db.commit()
+
+async def get_daily_active_user_counts(db: AsyncSession, since: datetime) -> List[Tuple[date, int]]:
+    """ تعداد کاربران متمایزی که در هر روز از since به بعد تسکی ثبت کرده‌اند. """
+    day = func.date(models.TaskLog.created_at)
+    result = await db.execute(
+        select(day, func.count(distinct(models.TaskLog.created_by_user_id)))
+        .filter(models.TaskLog.created_at >= since)
+        .group_by(day)
+        .order_by(day)
+    )
+    return [(row[0], row[1]) for row in result.all()]
+
+# --- DeviceMirror Operations ---
+
+async def get_device_mirror_high_water_mark(db: AsyncSession) -> Optional[datetime]:
+    """ جدیدترین _lastInform ثبت شده در آینه‌ی دستگاه‌ها. """
+    result = await db.execute(select(func.max(models.DeviceMirror.last_inform)))
+    return result.scalar()
+
+async def upsert_device_mirror(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """ خلاصه‌ی چند دستگاه را با یک INSERT ... ON CONFLICT DO UPDATE در آینه ثبت می‌کند. """
+    if not rows:
+        return
+    stmt = pg_insert(models.DeviceMirror).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.DeviceMirror.id],
+        set_={column: stmt.excluded[column] for column in rows[0] if column != "id"},
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+async def delete_device_mirror_synced_before(db: AsyncSession, before: datetime) -> int:
+    """ دستگاه‌هایی که در همگام‌سازی کامل دیده نشده‌اند (حذف شده از ACS) را پاک می‌کند. """
+    result = await db.execute(delete(models.DeviceMirror).where(models.DeviceMirror.synced_at < before))
+    await db.commit()
+    return result.rowcount
+
+async def get_device_mirror_page(db: AsyncSession, skip: int = 0, limit: int = 100,
+                                 product_class: Optional[str] = None) -> Tuple[List[models.DeviceMirror], int]:
+    """ یک صفحه از آینه (مرتب بر اساس id) و تعداد کل ردیف‌های منطبق را برمی‌گرداند. """
+    query = select(models.DeviceMirror)
+    count_query = select(func.count()).select_from(models.DeviceMirror)
+    if product_class:
+        query = query.where(models.DeviceMirror.product_class == product_class)
+        count_query = count_query.where(models.DeviceMirror.product_class == product_class)
+    items = (await db.execute(query.order_by(models.DeviceMirror.id).offset(skip).limit(limit))).scalars().all()
+    total = (await db.execute(count_query)).scalar()
+    return items, total
+
+async def get_all_device_mirror_rows(db: AsyncSession) -> List[models.DeviceMirror]:
+    """ تمام ردیف‌های آینه (برای بارگذاری ایندکس جستجو در شروع برنامه). """
+    result = await db.execute(select(models.DeviceMirror))
+    return result.scalars().all()
+
+async def get_device_mirror_rows_synced_since(db: AsyncSession, since: Optional[datetime]) -> List[models.DeviceMirror]:
+    """
+    ردیف‌هایی از آینه که از since به بعد همگام شده‌اند (برای workerهای پیرو). ردیف‌های یک دوره
+    همه یک synced_at دارند، پس خود since هم شامل می‌شود تا دوره‌ای که نیمه‌کاره خوانده شده جا نیفتد.
+    """
+    query = select(models.DeviceMirror)
+    if since is not None:
+        query = query.where(models.DeviceMirror.synced_at >= since)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+async def count_device_mirror_rows(db: AsyncSession) -> int:
+    result = await db.execute(select(func.count()).select_from(models.DeviceMirror))
+    return result.scalar()
+
+# --- Idempotency-Key Operations ---
+
+async def claim_idempotency_key(db: AsyncSession, user_id: int, key: str, request_hash: str,
+                                ttl: float) -> Optional[models.IdempotencyKey]:
+    """
+    کلید را برای این درخواست ثبت می‌کند (بدون commit؛ با اولین commit بعدی قطعی می‌شود).
+    اگر کلید تازه ثبت شد None و اگر قبلاً (در ttl ثانیه‌ی اخیر) ثبت شده بود ردیف موجود برمی‌گردد.
+    """
+    expired = models.IdempotencyKey.created_at < func.now() - timedelta(seconds=ttl)
+    stmt = pg_insert(models.IdempotencyKey).values(user_id=user_id, key=key, request_hash=request_hash)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.IdempotencyKey.user_id, models.IdempotencyKey.key],
+        set_={"request_hash": request_hash, "status_code": None, "response": None, "created_at": func.now()},
+        where=expired,
+    ).returning(models.IdempotencyKey.key)
+    if (await db.execute(stmt)).first() is not None:
+        # گاهی کلیدهای منقضی را هم پاک می‌کنیم تا جدول بی‌نهایت بزرگ نشود
+        if random.random() < 0.01:
+            await db.execute(delete(models.IdempotencyKey).where(expired))
+        return None
+    result = await db.execute(
+        select(models.IdempotencyKey).filter_by(user_id=user_id, key=key)
+    )
+    return result.scalars().first()
+
+async def store_idempotent_response(db: AsyncSession, user_id: int, key: str, status_code: int,
+                                    response: Any) -> None:
+    """ پاسخ نهایی درخواست را برای تکرارهای بعدی همان کلید ذخیره می‌کند؛ commit با فراخواننده است. """
+    await db.execute(
+        update(models.IdempotencyKey)
+        .filter_by(user_id=user_id, key=key)
+        .values(status_code=status_code, response=response)
+    )
+
+async def delete_idempotency_key(db: AsyncSession, user_id: int, key: str) -> None:
+    """ کلید را حذف می‌کند تا تکرار درخواست (پس از خطای موقت) دوباره اجرا شود؛ commit با فراخواننده است. """
+    await db.execute(delete(models.IdempotencyKey).filter_by(user_id=user_id, key=key))
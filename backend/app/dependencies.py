@@ -1,34 +1,66 @@
 # app/dependencies.py
 
+import hashlib
+import time
+from typing import Any, Dict
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 
-from . import crud, models, security
-from .database import get_db
+from . import crud_async, schemas, security
+from .cache import principal_cache, token_cache
+from .database import get_async_db
 
 # این متغیر و تمام توابع وابسته به آن به اینجا منتقل شدند
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-async def get_current_user_from_db(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """ کاربر را از روی توکن در پایگاه داده پیدا می‌کند """
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def get_token_claims(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
+    """
+    claims توکن JWT را برمی‌گرداند. FastAPI نتیجه‌ی یک وابستگی را در طول یک درخواست کش می‌کند،
+    پس require_permission و get_current_user_from_db توکن را فقط یک بار decode می‌کنند.
+    توکن‌های تأیید شده (با digest آن‌ها) تا زمان exp کش می‌شوند تا امضا دوباره بررسی نشود.
+    async است تا روی event loop (و نه در threadpool) اجرا شود؛ بررسی HMAC امضا بسیار سریع است.
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(digest)
+    if claims is not None:
+        if claims["exp"] > time.time():
+            return claims
+        token_cache.invalidate(digest)
     try:
-        payload = jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
+        claims = jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
     except JWTError:
-        raise credentials_exception
-    
-    user = crud.get_user_by_username(db, username=username)
+        raise _credentials_exception()
+    if "exp" in claims:
+        token_cache.set(digest, claims)
+    return claims
+
+async def get_current_user_from_db(claims: Dict[str, Any] = Depends(get_token_claims), db: AsyncSession = Depends(get_async_db)):
+    """
+    کاربر را از روی توکن در پایگاه داده پیدا می‌کند.
+    نتیجه برای مدت کوتاهی با کلید (username, iat) کش می‌شود؛ تغییرات ادمین کش را فوراً پاک می‌کنند.
+    به جای شیء ORM (که به session درخواست اول وابسته است) یک کپی ساده‌ی schemas.User کش می‌شود.
+    """
+    username: str = claims.get("sub")
+    if username is None:
+        raise _credentials_exception()
+
+    async def load_user():
+        user = await crud_async.get_user_by_username(db, username=username)
+        return schemas.User.model_validate(user) if user else None
+
+    user = await principal_cache.get_or_load((username, claims.get("iat")), load_user)
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
 
 def require_permission(required_perm: str):
@@ -36,24 +68,12 @@ def require_permission(required_perm: str):
     وابستگی اصلی برای چک کردن دسترسی.
     این تابع یک وابستگی دیگر را برمی‌گرداند که مجوز را چک می‌کند.
     """
-    def permission_checker(token: str = Depends(oauth2_scheme)):
-        credentials_exception = HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"You do not have permission to perform this action. Requires: {required_perm}"
-        )
-        try:
-            payload = jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
-            
-            if payload.get("is_admin", False):
-                return
-
-            permissions = payload.get("permissions", [])
-            if required_perm not in permissions:
-                raise credentials_exception
-        except JWTError:
+    def permission_checker(claims: Dict[str, Any] = Depends(get_token_claims)):
+        if claims.get("is_admin", False):
+            return
+        if required_perm not in claims.get("permissions", []):
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"You do not have permission to perform this action. Requires: {required_perm}"
             )
-    return permission_checker
\ No newline at end of file
+    return permission_checker
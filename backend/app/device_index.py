@@ -0,0 +1,158 @@
+# app/device_index.py
+# ایندکس محلی و قابل جستجوی دستگاه‌ها (شناسه، سریال، مدل، نسخه‌ی نرم‌افزار، IP، کاربر PPPoE)
+
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+# مسیرهای هر فیلد به ترتیب اولویت (TR-098 و سپس TR-181)
+FIELD_PATHS: Dict[str, List[str]] = {
+    "serial": ["_deviceId._SerialNumber"],
+    "oui": ["_deviceId._OUI"],
+    "product_class": ["_deviceId._ProductClass"],
+    "software_version": [
+        "InternetGatewayDevice.DeviceInfo.SoftwareVersion",
+        "Device.DeviceInfo.SoftwareVersion",
+    ],
+    "wan_ip": [
+        "InternetGatewayDevice.WANDevice.1.WANConnectionDevice.1.WANPPPConnection.1.ExternalIPAddress",
+        "InternetGatewayDevice.WANDevice.1.WANConnectionDevice.1.WANIPConnection.1.ExternalIPAddress",
+        "Device.IP.Interface.1.IPv4Address.1.IPAddress",
+    ],
+    "pppoe_user": [
+        "InternetGatewayDevice.WANDevice.1.WANConnectionDevice.1.WANPPPConnection.1.Username",
+        "Device.PPP.Interface.1.Username",
+    ],
+}
+
+# فیلدهای قابل جستجو
+SEARCH_FIELDS = ["id"] + list(FIELD_PATHS)
+
+# فقط همین مسیرها از GenieACS خوانده می‌شوند
+INDEX_PROJECTION = ",".join(["_id", "_lastInform"] + [path for paths in FIELD_PATHS.values() for path in paths])
+
+
+def _lookup(device: Dict[str, Any], path: str) -> Optional[str]:
+    node: Any = device
+    for part in path.split("."):
+        if not isinstance(node, dict) or part not in node:
+            return None
+        node = node[part]
+    if isinstance(node, dict):
+        node = node.get("_value")
+    return None if node in (None, "") else str(node)
+
+
+def extract_summary(device: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """ خلاصه‌ی قابل ایندکس یک سند دستگاه GenieACS (خوانده شده با INDEX_PROJECTION). """
+    summary: Dict[str, Optional[str]] = {"id": device.get("_id")}
+    for field, paths in FIELD_PATHS.items():
+        summary[field] = next((value for value in (_lookup(device, path) for path in paths) if value), None)
+    summary["last_inform"] = device.get("_lastInform")
+    return summary
+
+
+class _Snapshot(NamedTuple):
+    """ ساختار جستجوی ساخته شده؛ پس از انتشار تغییر نمی‌کند. """
+    order: List[Dict[str, Optional[str]]]
+    haystacks: Dict[str, str]
+    offsets: Dict[str, List[int]]
+    indexed_at: Optional[datetime]
+
+
+class DeviceIndex:
+    """
+    برای هر فیلد، مقادیر (با حروف کوچک) همه‌ی دستگاه‌ها در یک رشته‌ی واحد با جداکننده‌ی \\n
+    کنار هم قرار می‌گیرند. جستجوی substring با str.find (در C) و جستجوی prefix با یافتن
+    "\\n" + عبارت انجام می‌شود و محل یافته شده با bisect روی آرایه‌ی شروع‌ها به دستگاه نگاشت
+    می‌شود. حافظه تقریباً برابر حجم خود مقادیر است و جستجو روی ده‌ها هزار دستگاه چند میلی‌ثانیه طول می‌کشد.
+    """
+
+    def __init__(self):
+        self._rows: Dict[str, Dict[str, Optional[str]]] = {}
+        self._snapshot = _Snapshot([], {}, {}, None)
+
+    def __len__(self) -> int:
+        return len(self._snapshot.order)
+
+    @property
+    def indexed_at(self) -> Optional[datetime]:
+        return self._snapshot.indexed_at
+
+    def replace(self, summaries: Iterable[Dict[str, Optional[str]]]) -> None:
+        """ کل محتوای ایندکس را با این خلاصه‌ها جایگزین می‌کند (بارگذاری اولیه یا همگام‌سازی کامل). """
+        self._rows = {summary["id"]: summary for summary in summaries}
+        self._rebuild()
+
+    def upsert(self, summaries: Iterable[Dict[str, Optional[str]]]) -> None:
+        """
+        خلاصه‌ی چند دستگاه را اضافه یا جایگزین می‌کند و ساختار جستجو را (یک بار) دوباره می‌سازد؛
+        اگر هیچ خلاصه‌ای تغییر نکرده باشد بازسازی انجام نمی‌شود.
+        """
+        changed = False
+        for summary in summaries:
+            if self._rows.get(summary["id"]) != summary:
+                self._rows[summary["id"]] = summary
+                changed = True
+        if changed:
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        order = list(self._rows.values())
+        haystacks: Dict[str, str] = {}
+        offsets: Dict[str, List[int]] = {}
+        for field in SEARCH_FIELDS:
+            starts: List[int] = []
+            parts: List[str] = []
+            position = 1
+            for row in order:
+                value = (row.get(field) or "").lower().replace("\n", " ")
+                starts.append(position)
+                parts.append(value)
+                position += len(value) + 1
+            haystacks[field] = "\n" + "\n".join(parts) + "\n"
+            offsets[field] = starts
+        # انتشار با یک انتساب تا جستجوهای هم‌زمان (از thread دیگر) هیچ‌وقت ساختار نیمه‌کاره نبینند
+        self._snapshot = _Snapshot(order, haystacks, offsets, datetime.now(timezone.utc))
+
+    def search(self, q: str, fields: Optional[List[str]] = None, mode: str = "substring",
+               limit: int = 50) -> List[Dict[str, Optional[str]]]:
+        """
+        دستگاه‌هایی که یکی از fields (پیش‌فرض همه) با q شروع می‌شود (mode="prefix")
+        یا شامل q است (mode="substring") را بدون حساسیت به حروف بزرگ و کوچک برمی‌گرداند.
+        """
+        needle = q.lower().replace("\n", " ")
+        if not needle:
+            return []
+        order, haystacks, offsets, _ = self._snapshot
+        if mode == "prefix":
+            needle = "\n" + needle
+        found: Dict[int, None] = {}
+        for field in fields or SEARCH_FIELDS:
+            haystack, starts = haystacks.get(field), offsets.get(field)
+            if not haystack:
+                continue
+            position = haystack.find(needle)
+            while position != -1 and len(found) < limit:
+                # در حالت prefix محل یافته شده روی \n قبل از مقدار است
+                row = bisect_right(starts, position + (1 if mode == "prefix" else 0)) - 1
+                found[row] = None
+                # ادامه از ابتدای مقدار بعدی تا هر دستگاه فقط یک بار شمرده شود
+                next_start = starts[row + 1] - (1 if mode == "prefix" else 0) if row + 1 < len(starts) else len(haystack)
+                position = haystack.find(needle, next_start)
+            if len(found) >= limit:
+                break
+        return [order[row] for row in found]
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "devices": len(snapshot.order),
+            "indexed_at": snapshot.indexed_at.isoformat() if snapshot.indexed_at else None,
+            "bytes": sum(len(haystack) for haystack in snapshot.haystacks.values()),
+        }
+
+
+# یک نمونه از ایندکس دستگاه‌ها می‌سازیم تا در کل برنامه قابل استفاده باشد؛
+# محتوای آن را همگام‌ساز آینه‌ی دستگاه‌ها (device_mirror.py) به‌روز نگه می‌دارد
+device_index = DeviceIndex()
@@ -0,0 +1,261 @@
+# app/device_mirror.py
+# آینه‌ی محلی خلاصه‌ی دستگاه‌ها در پستگرس با همگام‌سازی افزایشی بر اساس _lastInform
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from . import crud_async, models, services
+from .config import settings
+from .database import AsyncSessionLocal, async_engine
+from .device_index import INDEX_PROJECTION, device_index, extract_summary
+
+logger = logging.getLogger(__name__)
+
+# کلید قفل advisory پستگرس؛ فقط workerی که آن را نگه دارد از GenieACS همگام‌سازی می‌کند
+MIRROR_LEADER_LOCK_KEY = 0x6A6B_0002
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _format_time(value: datetime) -> str:
+    # همان قالب تاریخ GenieACS (UTC با میلی‌ثانیه)
+    return value.astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def row_to_summary(row: models.DeviceMirror) -> Dict[str, Optional[str]]:
+    """ ردیف آینه را به شکل خلاصه‌ی ایندکس جستجو (همان خروجی extract_summary) تبدیل می‌کند. """
+    return {
+        "id": row.id,
+        "serial": row.serial,
+        "oui": row.oui,
+        "product_class": row.product_class,
+        "software_version": row.software_version,
+        "wan_ip": row.wan_ip,
+        "pppoe_user": row.pppoe_user,
+        "last_inform": _format_time(row.last_inform) if row.last_inform else None,
+    }
+
+
+class DeviceMirrorSync:
+    """
+    هر interval ثانیه فقط دستگاه‌هایی را از GenieACS می‌خواند که _lastInform آن‌ها از
+    high-water mark (بیشینه‌ی last_inform در آینه، منهای overlap) جدیدتر است و آن‌ها را
+    دسته‌ای در جدول device_mirror upsert و در ایندکس جستجو به‌روز می‌کند.
+    هر full_resync_interval ثانیه یک بار کل ناوگان خوانده و دستگاه‌های حذف شده از آینه پاک می‌شوند.
+
+    با چند worker فقط یکی (دارنده‌ی قفل advisory) از GenieACS می‌خواند و آینه را می‌نویسد؛
+    بقیه فقط ردیف‌های تازه‌ی آینه را در ایندکس جستجوی خودشان بارگذاری می‌کنند.
+    """
+
+    def __init__(self, interval: float, full_resync_interval: float, batch_size: int, overlap: float):
+        self.interval = interval
+        self.full_resync_interval = full_resync_interval
+        self.batch_size = batch_size
+        self.overlap = overlap
+        self.last_sync_at: Optional[datetime] = None
+        self.last_full_sync_at: Optional[datetime] = None
+        self.high_water_mark: Optional[datetime] = None
+        self.last_changed = 0
+        self.cycles = 0
+        self.failures = 0
+        self._task: Optional[asyncio.Task] = None
+        # اتصال اختصاصی که قفل رهبری را (در سطح session) نگه می‌دارد
+        self._leader_conn: Optional[AsyncConnection] = None
+        # بیشینه‌ی synced_at ردیف‌هایی که این worker (به عنوان پیرو) از آینه خوانده است
+        self._loaded_synced_at: Optional[datetime] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._release_leadership()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader_conn is not None
+
+    async def _try_lead(self) -> bool:
+        """ قفل رهبری را (بدون انتظار) می‌گیرد یا سالم بودن اتصال نگه‌دارنده‌ی آن را بررسی می‌کند. """
+        if self._leader_conn is not None:
+            try:
+                await self._leader_conn.execute(text("SELECT 1"))
+                await self._leader_conn.commit()
+                return True
+            except Exception:
+                logger.warning("Lost the device mirror leader connection", exc_info=True)
+                await self._drop_leader_conn()
+        conn = await async_engine.connect()
+        try:
+            acquired = await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": MIRROR_LEADER_LOCK_KEY})
+            # قفل session پس از commit باقی می‌ماند؛ اتصال نباید idle in transaction بماند
+            await conn.commit()
+        except BaseException:
+            await conn.invalidate()
+            raise
+        if not acquired:
+            await conn.close()
+            return False
+        logger.info("This worker now runs the device mirror sync")
+        self._leader_conn = conn
+        return True
+
+    async def _drop_leader_conn(self) -> None:
+        # اتصال بسته (نه به استخر برگردانده) می‌شود تا قفل همراه session آن آزاد شود
+        conn, self._leader_conn = self._leader_conn, None
+        if conn is not None:
+            try:
+                await conn.invalidate()
+            except Exception:
+                pass
+
+    async def _release_leadership(self) -> None:
+        if self._leader_conn is None:
+            return
+        try:
+            await self._leader_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIRROR_LEADER_LOCK_KEY})
+            await self._leader_conn.commit()
+            await self._leader_conn.close()
+            self._leader_conn = None
+        except Exception:
+            await self._drop_leader_conn()
+
+    async def _run(self) -> None:
+        try:
+            await self.load_index()
+        except Exception:
+            logger.exception("Failed to load device index from mirror")
+        while True:
+            try:
+                if await self._try_lead():
+                    full_due = (
+                        self.last_full_sync_at is None
+                        or datetime.now(timezone.utc) - self.last_full_sync_at >= timedelta(seconds=self.full_resync_interval)
+                    )
+                    await (self.full_resync() if full_due else self.sync_changes())
+                else:
+                    await self.follow_mirror()
+                self.cycles += 1
+            except Exception:
+                self.failures += 1
+                logger.exception("Device mirror sync failed")
+            await asyncio.sleep(self.interval)
+
+    async def load_index(self) -> None:
+        """ ایندکس جستجو را از آینه‌ی موجود پر می‌کند تا پس از راه‌اندازی بلافاصله قابل استفاده باشد. """
+        async with AsyncSessionLocal() as db:
+            rows = await crud_async.get_all_device_mirror_rows(db)
+            self.high_water_mark = await crud_async.get_device_mirror_high_water_mark(db)
+        self._loaded_synced_at = max((row.synced_at for row in rows), default=None)
+        device_index.replace(row_to_summary(row) for row in rows)
+
+    async def follow_mirror(self) -> int:
+        """
+        (worker پیرو) ردیف‌هایی از آینه را که رهبر از آخرین بار نوشته است در ایندکس بارگذاری می‌کند.
+        اگر تعداد ردیف‌های آینه با ایندکس نخواند (دستگاهی در همگام‌سازی کامل حذف شده)، کل ایندکس دوباره ساخته می‌شود.
+        """
+        async with AsyncSessionLocal() as db:
+            rows = await crud_async.get_device_mirror_rows_synced_since(db, self._loaded_synced_at)
+            total = await crud_async.count_device_mirror_rows(db)
+        if rows:
+            self._loaded_synced_at = max(row.synced_at for row in rows)
+            latest = max((row.last_inform for row in rows if row.last_inform), default=None)
+            if latest and (self.high_water_mark is None or latest > self.high_water_mark):
+                self.high_water_mark = latest
+            device_index.upsert([row_to_summary(row) for row in rows])
+            self.last_sync_at = self._loaded_synced_at
+        if total != len(device_index):
+            await self.load_index()
+        self.last_changed = len(rows)
+        return len(rows)
+
+    async def _sync(self, query: Optional[str]) -> List[Dict[str, Optional[str]]]:
+        """
+        دستگاه‌های منطبق با query را صفحه به صفحه می‌خواند و هر صفحه را یکجا در آینه upsert می‌کند.
+        خلاصه‌ها برگردانده می‌شوند تا فراخواننده ایندکس جستجو را فقط یک بار در هر دوره بازسازی کند.
+        """
+        synced_at = datetime.now(timezone.utc)
+        synced: List[Dict[str, Optional[str]]] = []
+        async for page in services.iter_device_pages_after(INDEX_PROJECTION, query, page_size=self.batch_size):
+            summaries = [extract_summary(device) for device in page]
+            rows: List[Dict[str, Any]] = [
+                {**summary, "last_inform": _parse_time(summary["last_inform"]), "synced_at": synced_at}
+                for summary in summaries
+            ]
+            async with AsyncSessionLocal() as db:
+                await crud_async.upsert_device_mirror(db, rows)
+            synced.extend(summaries)
+            latest = max((row["last_inform"] for row in rows if row["last_inform"]), default=None)
+            if latest and (self.high_water_mark is None or latest > self.high_water_mark):
+                self.high_water_mark = latest
+        self.last_changed = len(synced)
+        self.last_sync_at = synced_at
+        return synced
+
+    async def sync_changes(self) -> int:
+        """
+        فقط دستگاه‌های تغییر کرده از آخرین همگام‌سازی را می‌خواند. بازه‌ی overlap ثانیه‌ای باعث
+        می‌شود informهایی که هم‌زمان با همگام‌سازی قبلی ثبت شده‌اند جا نیفتند (upsert تکراری بی‌ضرر است).
+        """
+        if self.high_water_mark is None:
+            return await self.full_resync()
+        since = self.high_water_mark - timedelta(seconds=self.overlap)
+        summaries = await self._sync(json.dumps({"_lastInform": {"$gte": _format_time(since)}}))
+        if summaries:
+            # بازسازی ساختار جستجو با GIL اجرا می‌شود؛ فقط یک بار در هر دوره
+            device_index.upsert(summaries)
+        return len(summaries)
+
+    async def full_resync(self) -> int:
+        """ کل ناوگان را همگام می‌کند و دستگاه‌هایی را که دیگر در ACS نیستند از آینه و ایندکس حذف می‌کند. """
+        started = datetime.now(timezone.utc)
+        summaries = await self._sync(None)
+        async with AsyncSessionLocal() as db:
+            removed = await crud_async.delete_device_mirror_synced_before(db, started)
+        if removed:
+            logger.info("Removed %d devices no longer present in GenieACS from the mirror", removed)
+        # همه‌ی دستگاه‌های موجود همین الان خوانده شده‌اند؛ ایندکس یک بار با آن‌ها جایگزین می‌شود
+        device_index.replace(summaries)
+        self.last_full_sync_at = started
+        return len(summaries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "last_sync_at": self.last_sync_at.isoformat() if self.last_sync_at else None,
+            "last_full_sync_at": self.last_full_sync_at.isoformat() if self.last_full_sync_at else None,
+            "high_water_mark": self.high_water_mark.isoformat() if self.high_water_mark else None,
+            "last_changed": self.last_changed,
+            "cycles": self.cycles,
+            "failures": self.failures,
+            "leader": self.is_leader,
+            "index": device_index.stats(),
+        }
+
+
+# یک نمونه از همگام‌ساز آینه می‌سازیم تا در کل برنامه قابل استفاده باشد
+device_mirror_sync = DeviceMirrorSync(
+    interval=settings.DEVICE_MIRROR_SYNC_INTERVAL,
+    full_resync_interval=settings.DEVICE_MIRROR_FULL_RESYNC_INTERVAL,
+    batch_size=settings.DEVICE_MIRROR_BATCH_SIZE,
+    overlap=settings.DEVICE_MIRROR_SYNC_OVERLAP,
+)
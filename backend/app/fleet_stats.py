@@ -0,0 +1,133 @@
+# app/fleet_stats.py
+
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from . import crud_async, services
+from .config import settings
+from .database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# فقط همین فیلدها از GenieACS خوانده می‌شوند
+STATS_PROJECTION = ",".join([
+    "_id",
+    "_lastInform",
+    "_deviceId._ProductClass",
+    "InternetGatewayDevice.DeviceInfo.SoftwareVersion",
+    "Device.DeviceInfo.SoftwareVersion",
+])
+
+# نام روزهای هفته به ترتیب datetime.weekday() (دوشنبه = 0)
+WEEKDAY_NAMES = ["دوشنبه", "سه‌شنبه", "چهارشنبه", "پنجشنبه", "جمعه", "شنبه", "یکشنبه"]
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _software_version(device: Dict[str, Any]) -> Optional[str]:
+    for root in ("InternetGatewayDevice", "Device"):
+        node = device.get(root, {}).get("DeviceInfo", {}).get("SoftwareVersion", {})
+        if "_value" in node:
+            return node["_value"]
+    return None
+
+
+class FleetStatsAggregator:
+    """
+    آمار ناوگان را به صورت دوره‌ای در پس‌زمینه محاسبه و در حافظه نگه می‌دارد تا
+    اندپوینت‌های نمودار بدون فراخوانی ACS یا پایگاه داده پاسخ دهند.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.snapshot: Dict[str, Any] = {
+            "device_status": [],
+            "models": [],
+            "firmware": [],
+            "daily_active_users": [],
+            "total_devices": 0,
+            "computed_at": None,
+            "stale": False,
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                # snapshot قبلی نگه داشته و فقط به عنوان کهنه علامت زده می‌شود
+                self.snapshot = {**self.snapshot, "stale": True}
+                logger.exception("Failed to compute fleet statistics")
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self) -> None:
+        """
+        یک بار آمار دستگاه‌ها و کاربران فعال را محاسبه و snapshot را جایگزین می‌کند.
+        خطای ACS به داده‌ی آزمایشی برنمی‌گردد و raise می‌شود تا snapshot ناقص یا ساختگی منتشر نشود.
+        """
+        now = datetime.now(timezone.utc)
+        online_after = now - timedelta(seconds=settings.FLEET_ONLINE_THRESHOLD)
+        stale_before = now - timedelta(seconds=settings.FLEET_STALE_THRESHOLD)
+
+        status_counts = Counter({"Online": 0, "Offline": 0, "Stale": 0})
+        model_counts: Counter = Counter()
+        firmware_counts: Counter = Counter()
+        total = 0
+        async for page in services.iter_device_pages_after(STATS_PROJECTION, page_size=settings.FLEET_STATS_PAGE_SIZE):
+            for device in page:
+                total += 1
+                last_inform = _parse_time(device.get("_lastInform"))
+                if last_inform is None or last_inform < stale_before:
+                    status_counts["Stale"] += 1
+                elif last_inform >= online_after:
+                    status_counts["Online"] += 1
+                else:
+                    status_counts["Offline"] += 1
+                model_counts[device.get("_deviceId", {}).get("_ProductClass") or "Unknown"] += 1
+                firmware_counts[_software_version(device) or "Unknown"] += 1
+
+        # کاربران فعال روزانه در هفت روز گذشته بر اساس task_logs
+        first_day = (now - timedelta(days=6)).date()
+        async with AsyncSessionLocal() as db:
+            rows = dict(await crud_async.get_daily_active_user_counts(
+                db, since=datetime.combine(first_day, datetime.min.time(), tzinfo=timezone.utc)
+            ))
+        days = [first_day + timedelta(days=offset) for offset in range(7)]
+
+        self.snapshot = {
+            "device_status": [{"name": name, "value": value} for name, value in status_counts.items()],
+            "models": [{"name": name, "value": value} for name, value in model_counts.most_common()],
+            "firmware": [{"name": name, "value": value} for name, value in firmware_counts.most_common()],
+            "daily_active_users": [{"name": WEEKDAY_NAMES[day.weekday()], "users": rows.get(day, 0)} for day in days],
+            "total_devices": total,
+            "computed_at": now.isoformat(),
+            "stale": False,
+        }
+
+
+# یک نمونه از جمع‌کننده‌ی آمار می‌سازیم تا در کل برنامه قابل استفاده باشد
+fleet_stats = FleetStatsAggregator(interval=settings.FLEET_STATS_INTERVAL)
@@ -3,15 +3,23 @@
 from fastapi import Depends, FastAPI, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.middleware.gzip import GZipMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from . import crud, models, schemas, security
-from .database import engine, get_db
+from . import crud_async, models, schemas, security, services
+from .database import engine, async_engine, get_async_db
 from .routers import admin, acs, websockets   # وارد کردن روترهای ادمین و acs
 from . import dependencies
+from .webhook_ingest import webhook_ingestor
+from .websocket_manager import manager
+from .fleet_stats import fleet_stats
+from .device_mirror import device_mirror_sync
+from .partitions import PartitionMaintenance
+from .config import settings
 
-# این خط باید در ابتدای برنامه باشد تا جداول ساخته شوند
-models.Base.metadata.create_all(bind=engine)
+# جداول، ایندکس‌ها و پارتیشن‌ها پیش از اجرای برنامه با `python task_logs_maintenance.py setup`
+# (یا create_initial_data.py) ساخته می‌شوند؛ راه‌اندازی برنامه هیچ DDL اجرا نمی‌کند
+partition_maintenance = PartitionMaintenance(engine, interval=settings.TASK_LOG_MAINTENANCE_INTERVAL)
 
 app = FastAPI(
     title="jk-acs API",
@@ -31,6 +39,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.RESPONSE_GZIP_ENABLED:
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=settings.RESPONSE_GZIP_MIN_SIZE,
+        compresslevel=settings.RESPONSE_GZIP_LEVEL,
+    )
 
 # اضافه کردن تمام روترها به برنامه اصلی
 app.include_router(admin.router)
@@ -40,13 +54,48 @@ app.include_router(acs.webhook_router)
 app.include_router(websockets.router)
 
 
+@app.on_event("startup")
+async def start_background_services():
+    """ backend انتشار WebSocket و کارهای پس‌زمینه (صف وب‌هوک، آمار ناوگان، آینه و ایندکس دستگاه‌ها، نگهداری پارتیشن‌ها) را راه‌اندازی می‌کند. """
+    services.client.start()
+    await manager.start()
+    webhook_ingestor.start()
+    fleet_stats.start()
+    device_mirror_sync.start()
+    partition_maintenance.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    """ کارهای پس‌زمینه و backend انتشار را متوقف و کلاینت ACS و اتصال‌های استخر async را می‌بندد. """
+    await partition_maintenance.stop()
+    await device_mirror_sync.stop()
+    await fleet_stats.stop()
+    await webhook_ingestor.stop()
+    await manager.stop()
+    await services.client.aclose()
+    await async_engine.dispose()
+    security.password_hasher.shutdown()
+
+
 # --- روت‌های اصلی برنامه که در فایل جداگانه‌ای نیستند ---
 
 @app.post("/auth/token", response_model=schemas.Token, tags=["Authentication"])
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """ برای دریافت توکن JWT لاگین کنید """
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    user = await crud_async.get_user_by_username(db, username=form_data.username)
+    if not user:
+        await security.password_hasher.reject_unknown_user()
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
+    try:
+        password_ok = await security.password_hasher.verify(form_data.password, user.hashed_password)
+    except security.PasswordHashBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many concurrent logins, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    if not password_ok:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
 
     user_permissions = [perm.name for perm in user.permissions]
@@ -60,7 +109,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 
 @app.get("/users/me", response_model=schemas.User, tags=["Users"])
-async def read_users_me(current_user: models.User = Depends(dependencies.get_current_user_from_db)):
+async def read_users_me(current_user: schemas.User = Depends(dependencies.get_current_user_from_db)):
     """ اطلاعات کاربر لاگین کرده را برمی‌گرداند """
     return current_user
 
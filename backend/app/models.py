@@ -1,6 +1,6 @@
 # app/models.py
 
-from sqlalchemy import Boolean, Column, Integer, String, Table, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, String, Table, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 from sqlalchemy.dialects.postgresql import JSONB
@@ -40,14 +40,69 @@ class Permission(Base):
 
 class TaskLog(Base):
     __tablename__ = "task_logs"
-    id = Column(Integer, primary_key=True, index=True)
-    device_id = Column(String, index=True, nullable=False)
-    task_name = Column(String, index=True, nullable=False)
+    # جدول بر اساس created_at به صورت ماهانه پارتیشن‌بندی می‌شود (app/partitions.py)،
+    # پس کلید اصلی در پایگاه داده (id, created_at) است؛ ORM همچنان فقط id را کلید می‌داند
+    # ایندکس تک‌ستونی نمی‌گیرند: id ستون اول کلید اصلی است و device_id و task_name
+    # ستون اول ایندکس‌های ترکیبی پایین‌اند؛ هر ایندکس اضافه هزینه‌ی نوشتن در همه‌ی پارتیشن‌هاست
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(String, nullable=False)
+    task_name = Column(String, nullable=False)
     status = Column(String, default="sent") # e.g., "sent", "failed"
     payload = Column(JSONB) # برای ذخیره اطلاعات ارسال شده
     response = Column(JSONB) # برای ذخیره پاسخ دریافتی
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     genieacs_task_id = Column(String, nullable=True, index=True) # <-- فیلد جدید
     # ForeignKey به جدول کاربران برای اینکه بدانیم چه کسی دستور را صادر کرده
     created_by_user_id = Column(Integer, ForeignKey("users.id"))
-    created_by = relationship("User")
\ No newline at end of file
+    created_by = relationship("User")
+
+    __table_args__ = (
+        # برای جستجوی تسک‌های در انتظار یک دستگاه (وب‌هوک)
+        Index("ix_task_logs_device_status_created", "device_id", "status", "created_at"),
+        # برای صفحه‌بندی keyset روی (created_at, id) در تاریخچه‌ی دستگاه و جستجوی کلی
+        Index("ix_task_logs_device_created_id", "device_id", "created_at", "id"),
+        Index("ix_task_logs_created_id", "created_at", "id"),
+        Index("ix_task_logs_status_created_id", "status", "created_at", "id"),
+        Index("ix_task_logs_task_name_created_id", "task_name", "created_at", "id"),
+        Index("ix_task_logs_user_created_id", "created_by_user_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+
+class PendingTaskGuard(Base):
+    __tablename__ = "pending_task_guards"
+    # برای هر (دستگاه، نام تسک) در انتظار دقیقاً یک ردیف؛ کلید اصلی همان قید یکتایی است.
+    # task_logs پارتیشن‌بندی شده و ایندکس یکتا روی آن باید created_at را هم شامل شود،
+    # پس این قید در جدول کوچک جداگانه‌ای نگه داشته می‌شود
+    device_id = Column(String, primary_key=True)
+    task_name = Column(String, primary_key=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    # پاسخ ذخیره شده‌ی درخواست‌های دارای هدر Idempotency-Key (برای هر کاربر جداگانه)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String, primary_key=True)
+    # هش بدنه‌ی درخواست تا استفاده‌ی مجدد از کلید با درخواست متفاوت رد شود
+    request_hash = Column(String, nullable=False)
+    # تا وقتی درخواست اول در حال اجراست status_code و response خالی‌اند
+    status_code = Column(Integer)
+    response = Column(JSONB)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+
+class DeviceMirror(Base):
+    __tablename__ = "device_mirror"
+    # خلاصه‌ی هر دستگاه GenieACS که همگام‌ساز پس‌زمینه (app/device_mirror.py) به‌روز نگه می‌دارد
+    id = Column(String, primary_key=True)
+    serial = Column(String)
+    oui = Column(String)
+    product_class = Column(String, index=True)
+    software_version = Column(String)
+    wan_ip = Column(String)
+    pppoe_user = Column(String)
+    # _lastInform دستگاه؛ بیشینه‌ی آن نقطه‌ی شروع همگام‌سازی افزایشی بعدی است
+    last_inform = Column(DateTime(timezone=True), index=True)
+    synced_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
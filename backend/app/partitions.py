@@ -0,0 +1,271 @@
+# app/partitions.py
+# پارتیشن‌بندی ماهانه‌ی task_logs و بایگانی پارتیشن‌های قدیمی
+
+import asyncio
+import gzip
+import logging
+import os
+import re
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+TABLE = "task_logs"
+PARTITION_NAME = re.compile(r"^task_logs_y(\d{4})m(\d{2})$")
+DEFAULT_PARTITION = f"{TABLE}_default"
+# ایندکس‌هایی که نسخه‌های قبلی روی task_logs می‌ساختند و دیگر لازم نیستند
+REDUNDANT_TASK_LOG_INDEXES = ["ix_task_logs_id", "ix_task_logs_device_id", "ix_task_logs_task_name"]
+# کلید قفل advisory پستگرس برای نگهداری پارتیشن‌ها؛ فقط یک پردازه (worker یا اسکریپت) در هر لحظه
+MAINTENANCE_LOCK_KEY = 0x6A6B_0001
+
+
+def _add_months(day: date, months: int) -> date:
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"{TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def is_partitioned(engine: Engine) -> bool:
+    """ آیا task_logs در پایگاه داده یک جدول پارتیشن‌بندی شده است. """
+    with engine.connect() as conn:
+        relkind = conn.execute(
+            text("SELECT relkind FROM pg_class WHERE relname = :name AND relkind IN ('r', 'p')"),
+            {"name": TABLE}
+        ).scalar()
+    return relkind == "p"
+
+
+def list_partitions(engine: Engine) -> List[str]:
+    """ نام پارتیشن‌های ماهانه‌ی متصل به task_logs را برمی‌گرداند. """
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :name"
+        ), {"name": TABLE}).scalars().all()
+    return sorted(name for name in rows if PARTITION_NAME.match(name))
+
+
+@contextmanager
+def maintenance_lock(engine: Engine) -> Iterator[bool]:
+    """
+    قفل advisory نگهداری پارتیشن‌ها را (بدون انتظار) می‌گیرد و True/False برمی‌گرداند.
+    همه‌ی workerها و task_logs_maintenance.py پیش از ساخت، بایگانی یا حذف پارتیشن آن را می‌گیرند
+    تا روی فایل بایگانی و DETACH/DROP یک پارتیشن با هم رقابت نکنند.
+    """
+    with engine.connect() as conn:
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY}).scalar()
+        # قفل در سطح session است و پس از commit باقی می‌ماند؛ اتصال نباید idle in transaction بماند
+        conn.commit()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+                conn.commit()
+
+
+def ensure_partitions(engine: Engine, months_ahead: int = settings.TASK_LOG_PARTITION_MONTHS_AHEAD,
+                      start: Optional[date] = None) -> None:
+    """
+    پارتیشن ماه جاری (یا از start) تا months_ahead ماه بعد و یک پارتیشن DEFAULT را می‌سازد.
+    اگر task_logs هنوز پارتیشن‌بندی نشده باشد (نصب قدیمی)، کاری انجام نمی‌دهد.
+    ردیف‌هایی که پیش از ساخت پارتیشن یک ماه در DEFAULT نوشته شده‌اند (مثلاً created_at آینده)
+    به پارتیشن جدید منتقل می‌شوند؛ وگرنه CREATE TABLE ... PARTITION OF برای آن بازه خطا می‌دهد.
+    """
+    if not is_partitioned(engine):
+        logger.warning("%s is not partitioned; run `python task_logs_maintenance.py migrate`", TABLE)
+        return
+    existing = set(list_partitions(engine))
+    current = (start or datetime.now(timezone.utc).date()).replace(day=1)
+    last = _add_months(datetime.now(timezone.utc).date().replace(day=1), months_ahead)
+    with engine.begin() as conn:
+        has_default = conn.execute(text(f"SELECT to_regclass('{DEFAULT_PARTITION}') IS NOT NULL")).scalar()
+        while current <= last:
+            upper = _add_months(current, 1)
+            name = _partition_name(current)
+            bounds = f"FOR VALUES FROM ('{current.isoformat()}') TO ('{upper.isoformat()}')"
+            in_range = f"created_at >= '{current.isoformat()}' AND created_at < '{upper.isoformat()}'"
+            if name not in existing and has_default and conn.execute(
+                text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})")
+            ).scalar():
+                # DEFAULT موقتاً جدا می‌شود تا ردیف‌های این بازه به پارتیشن جدید منتقل شوند (در یک تراکنش)
+                conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+                conn.execute(text(f"CREATE TABLE {name} PARTITION OF {TABLE} {bounds}"))
+                moved = conn.execute(text(f"INSERT INTO {TABLE} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}")).rowcount
+                conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"))
+                conn.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+                logger.info("Moved %d rows from %s into new partition %s", moved, DEFAULT_PARTITION, name)
+            elif name not in existing:
+                conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} {bounds}"))
+            current = upper
+        if not has_default:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+
+
+def setup_schema(engine: Engine) -> None:
+    """
+    جداول، ایندکس‌های task_logs، پارتیشن‌های ماهانه و قفل تسک‌های در انتظار موجود را می‌سازد (idempotent).
+    مرحله‌ی صریح استقرار است (task_logs_maintenance.py setup یا create_initial_data.py)،
+    نه بخشی از راه‌اندازی برنامه، تا هر worker هنگام import دستور DDL اجرا نکند.
+    """
+    from .models import Base, DeviceMirror, TaskLog
+
+    Base.metadata.create_all(bind=engine)
+    # create_all ایندکس‌های جدید را روی جداول موجود نمی‌سازد
+    for index in [*TaskLog.__table__.indexes, *DeviceMirror.__table__.indexes]:
+        index.create(bind=engine, checkfirst=True)
+    # ایندکس‌های تک‌ستونی قدیمی که ایندکس‌های ترکیبی جایگزینشان شده‌اند
+    with engine.begin() as conn:
+        for name in REDUNDANT_TASK_LOG_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    # پارتیشن‌های ماهانه‌ی task_logs برای ماه جاری و ماه‌های آینده
+    ensure_partitions(engine)
+    backfill_pending_task_guards(engine)
+
+
+def backfill_pending_task_guards(engine: Engine) -> int:
+    """
+    برای تسک‌های در انتظاری که پیش از وجود جدول pending_task_guards ثبت شده‌اند قفل می‌سازد
+    تا دستور تکراری برایشان پذیرفته نشود. زمان قفل همان زمان آخرین تسک است تا TTL از همان‌جا حساب شود.
+    """
+    with engine.begin() as conn:
+        result = conn.execute(text(
+            "INSERT INTO pending_task_guards (device_id, task_name, created_at) "
+            f"SELECT device_id, task_name, max(created_at) FROM {TABLE} "
+            "WHERE status = 'sent_to_genieacs' GROUP BY device_id, task_name "
+            "ON CONFLICT DO NOTHING"
+        ))
+    if result.rowcount:
+        logger.info("Created %d pending-task guards for existing pending tasks", result.rowcount)
+    return result.rowcount
+
+
+def migrate_to_partitioned(engine: Engine) -> None:
+    """
+    یک جدول task_logs معمولی (نصب‌های قبلی) را به جدول پارتیشن‌بندی شده تبدیل می‌کند.
+    داده‌ها کپی و sequence شناسه‌ها ادامه داده می‌شود.
+    """
+    from .models import TaskLog
+
+    if is_partitioned(engine):
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_legacy"))
+        conn.execute(text(f"ALTER TABLE {TABLE}_legacy RENAME CONSTRAINT {TABLE}_pkey TO {TABLE}_legacy_pkey"))
+        # ایندکس‌ها و sequence با نام قبلی روی جدول قدیمی می‌مانند؛ تغییر نامشان می‌دهیم
+        for index in TaskLog.__table__.indexes:
+            conn.execute(text(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_legacy"))
+        conn.execute(text(f"ALTER TABLE {TABLE}_legacy ALTER COLUMN id DROP DEFAULT"))
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS {TABLE}_id_seq RENAME TO {TABLE}_legacy_id_seq"))
+        oldest = conn.execute(text(f"SELECT min(created_at) FROM {TABLE}_legacy")).scalar()
+        TaskLog.__table__.create(bind=conn)
+
+    ensure_partitions(engine, start=oldest.date() if oldest else None)
+
+    with engine.begin() as conn:
+        columns = ", ".join(column.name for column in TaskLog.__table__.columns)
+        conn.execute(text(
+            f"INSERT INTO {TABLE} ({columns}) "
+            f"SELECT {columns.replace('created_at', 'COALESCE(created_at, now())')} FROM {TABLE}_legacy"
+        ))
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)"
+        ))
+        conn.execute(text(f"DROP TABLE {TABLE}_legacy"))
+        conn.execute(text(f"DROP SEQUENCE IF EXISTS {TABLE}_legacy_id_seq"))
+
+
+def archive_old_partitions(engine: Engine, retention_months: int = settings.TASK_LOG_RETENTION_MONTHS,
+                           archive_dir: str = settings.TASK_LOG_ARCHIVE_DIR) -> List[Path]:
+    """
+    پارتیشن‌های قدیمی‌تر از retention_months را به فایل NDJSON فشرده (gzip) در archive_dir
+    می‌نویسد، سپس آن‌ها را از task_logs جدا (DETACH) و حذف می‌کند.
+    فایل ابتدا با پسوند .tmp نوشته می‌شود تا پارتیشن فقط پس از بایگانی کامل حذف شود.
+    """
+    cutoff = _add_months(datetime.now(timezone.utc).date().replace(day=1), -retention_months)
+    target_dir = Path(archive_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    archived: List[Path] = []
+
+    for name in list_partitions(engine):
+        year, month = (int(part) for part in PARTITION_NAME.match(name).groups())
+        if date(year, month, 1) >= cutoff:
+            continue
+
+        path = target_dir / f"{name}.ndjson.gz"
+        tmp_path = path.with_suffix(".gz.tmp")
+        raw = engine.raw_connection()
+        try:
+            with gzip.open(tmp_path, "wb") as archive, raw.cursor() as cursor:
+                # بایگانی یک پارتیشن کامل ممکن است از statement_timeout عادی طولانی‌تر باشد
+                cursor.execute("SET statement_timeout = 0")
+                cursor.copy_expert(f"COPY (SELECT row_to_json(t) FROM {name} t ORDER BY id) TO STDOUT", archive)
+        finally:
+            raw.close()
+        os.replace(tmp_path, path)
+
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+        logger.info("Archived partition %s to %s", name, path)
+        archived.append(path)
+    return archived
+
+
+def run_maintenance(engine: Engine) -> List[Path]:
+    """
+    ساخت پارتیشن‌های ماه‌های آینده و بایگانی پارتیشن‌های قدیمی.
+    فقط پردازه‌ای که قفل نگهداری را بگیرد اجرا می‌کند؛ بقیه‌ی workerها این دوره را رد می‌کنند.
+    """
+    if not is_partitioned(engine):
+        logger.warning("%s is not partitioned; skipping maintenance", TABLE)
+        return []
+    with maintenance_lock(engine) as acquired:
+        if not acquired:
+            logger.debug("Partition maintenance is running elsewhere; skipping this cycle")
+            return []
+        ensure_partitions(engine)
+        return archive_old_partitions(engine)
+
+
+class PartitionMaintenance:
+    """ اجرای دوره‌ای run_maintenance در پس‌زمینه (در thread جدا چون از engine همگام استفاده می‌کند). """
+
+    def __init__(self, engine: Engine, interval: float):
+        self.engine = engine
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(run_maintenance, self.engine)
+            except Exception:
+                logger.exception("task_logs partition maintenance failed")
+            await asyncio.sleep(self.interval)
@@ -1,13 +1,23 @@
 # app/routers/acs.py
 
-from fastapi import APIRouter, Depends, HTTPException, Request, Header, status
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Header, Query, status
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from typing import List, Dict, Any, Literal, Optional
+from datetime import datetime
 from sqlalchemy.orm import Session
-from .. import crud, database, schemas, models
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import crud, crud_async, database, schemas, models
 from ..websocket_manager import manager
+from ..webhook_ingest import webhook_ingestor
+from ..fleet_stats import fleet_stats
+from ..device_index import SEARCH_FIELDS, device_index
+from ..device_mirror import device_mirror_sync, row_to_summary
+import hashlib
+import hmac
 import json
 
 from .. import services, dependencies
+from ..config import settings
 
 # --- روتر امن برای ارتباط با GenieACS ---
 # این روتر برای تمام اندپوینت‌های خود نیازمند دسترسی 'acs:view_details' است
@@ -18,7 +28,8 @@ router = APIRouter(
 )
 
 # --- روتر برای داده‌های نمودارها ---
-# این روتر نیاز به احراز هویت ندارد و تگ جداگانه‌ای دارد
+# این روتر نیاز به احراز هویت ندارد و تگ جداگانه‌ای دارد؛
+# نمودارهایی که فهرست مدل‌ها و نسخه‌های نرم‌افزار ناوگان را نشان می‌دهند کاربر لاگین کرده می‌خواهند
 chart_router = APIRouter(
     prefix="/acs/chart",
     tags=["Charts"]
@@ -31,43 +42,152 @@ webhook_router = APIRouter(
 )
 
 @router.get("/devices/", response_model=List[Dict[str, Any]])
-async def get_all_devices():
+async def get_all_devices(
+    query: Optional[str] = Query(None, description="فیلتر MongoDB به صورت JSON، مثلاً {\"_deviceId._ProductClass\": \"HG8245\"}"),
+    projection: Optional[str] = Query(None, description="لیست مسیر پارامترها با کاما، مثلاً _id,_lastInform"),
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    sort: Optional[str] = Query(None, description="ترتیب به صورت JSON، مثلاً {\"_lastInform\": -1}"),
+):
+    """
+    لیست مودم‌ها را از سرور GenieACS دریافت می‌کند.
+    فیلتر، projection و صفحه‌بندی مستقیماً به GenieACS ارسال می‌شوند.
+    با ACS_RAW_PASSTHROUGH بدنه‌ی پاسخ GenieACS بدون decode و اعتبارسنجی مجدد فرستاده می‌شود.
+    """
+    if settings.ACS_RAW_PASSTHROUGH:
+        body = await services.get_all_devices_raw_from_acs(
+            query=query, projection=projection, skip=skip, limit=limit, sort=sort
+        )
+        return Response(content=body, media_type="application/json")
+    return await services.get_all_devices_from_acs(
+        query=query, projection=projection, skip=skip, limit=limit, sort=sort
+    )
+
+@router.get("/devices/search", response_model=schemas.DeviceSearchResult)
+def search_devices(
+    q: str = Query(..., min_length=1, description="عبارت جستجو، مثلاً بخشی از سریال، IP یا نام کاربری PPPoE"),
+    field: Optional[List[str]] = Query(None, description="محدود کردن به فیلدها (قابل تکرار): " + ", ".join(SEARCH_FIELDS)),
+    mode: Literal["prefix", "substring"] = Query("substring"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    دستگاه‌ها را در ایندکس محلی (بدون فراخوانی ACS) بر اساس شناسه، سریال، OUI، مدل،
+    نسخه‌ی نرم‌افزار، IP WAN یا نام کاربری PPPoE جستجو می‌کند.
+    """
+    unknown = set(field or []) - set(SEARCH_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown search fields: {', '.join(sorted(unknown))}")
+    return {
+        "items": device_index.search(q, fields=field, mode=mode, limit=limit),
+        "indexed_at": device_index.indexed_at,
+        "total_indexed": len(device_index),
+    }
+
+
+@router.get("/devices/mirror", response_model=schemas.DeviceMirrorPage)
+async def get_mirrored_devices(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    product_class: Optional[str] = Query(None),
+    db: AsyncSession = Depends(database.get_async_db),
+):
     """
-    لیست تمام مودم‌ها را از سرور GenieACS دریافت می‌کند.
+    خلاصه‌ی دستگاه‌ها را از آینه‌ی محلی پستگرس (بدون فراخوانی ACS) برمی‌گرداند.
+    synced_at زمان آخرین همگام‌سازی است؛ داده‌ها حداکثر به اندازه‌ی فاصله‌ی همگام‌سازی کهنه‌اند.
     """
-    return await services.get_all_devices_from_acs()
+    items, total = await crud_async.get_device_mirror_page(db, skip=skip, limit=limit, product_class=product_class)
+    return {
+        "items": [row_to_summary(row) for row in items],
+        "total": total,
+        "synced_at": device_mirror_sync.last_sync_at,
+    }
+
+
+@router.get(
+    "/devices/export",
+    response_class=StreamingResponse,
+    dependencies=[Depends(dependencies.require_permission("acs:export"))]
+)
+async def export_devices(
+    query: Optional[str] = Query(None, description="فیلتر MongoDB به صورت JSON"),
+    projection: Optional[str] = Query(None, description="لیست مسیر پارامترها با کاما؛ _id همیشه اضافه می‌شود"),
+    after: Optional[str] = Query(None, description="ادامه‌ی خروجی از بعد از این _id"),
+    page_size: int = Query(settings.FLEET_EXPORT_PAGE_SIZE, ge=1, le=5000),
+    gzip: bool = Query(False, description="فایل خروجی به صورت .ndjson.gz"),
+):
+    """
+    کل ناوگان (یا دستگاه‌های منطبق با query) را به صورت NDJSON و به ترتیب _id استریم می‌کند.
+    برای ادامه‌ی یک خروجی ناتمام، _id آخرین خط دریافت شده را در after بفرستید.
+    نیازمند دسترسی 'acs:export' است.
+    """
+    body = services.export_devices_ndjson(
+        query=query, projection=projection, after=after, page_size=page_size, compress=gzip
+    )
+    filename = "fleet.ndjson.gz" if gzip else "fleet.ndjson"
+    return StreamingResponse(
+        body,
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 
 @router.get("/devices/{device_id}", response_model=Dict[str, Any])
-async def get_specific_device(device_id: str):
+async def get_specific_device(
+    device_id: str,
+    response: Response,
+    projection: Optional[str] = Query(None, description="فقط این مسیرها (با کاما)، مثلاً InternetGatewayDevice.DeviceInfo,InternetGatewayDevice.LANDevice"),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     اطلاعات یک دستگاه خاص را از GenieACS دریافت می‌کند.
+    پاسخ ETag دارد؛ اگر دستگاه از زمان ETag ارسالی در If-None-Match تغییری نکرده باشد 304 برمی‌گردد.
     """
-    return await services.get_device_details_from_acs(device_id)
+    device = await services.get_device_details_from_acs(device_id, projection)
+    etag = services.device_etag(device, projection)
+    if services.etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    # مرورگر پاسخ را نگه می‌دارد اما پیش از استفاده با If-None-Match اعتبارسنجی می‌کند
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if settings.ACS_RAW_PASSTHROUGH:
+        # سند دستگاه بدون اعتبارسنجی response_model و با orjson سریال می‌شود
+        return ORJSONResponse(device, headers=headers)
+    response.headers.update(headers)
+    return device
+
+
+@router.get("/devices/{device_id}/flat", response_model=Dict[str, Any])
+async def get_specific_device_flat(
+    device_id: str,
+    prefix: Optional[List[str]] = Query(None, description="پیشوند مسیر پارامترها، مثلاً InternetGatewayDevice.DeviceInfo (قابل تکرار)")
+):
+    """
+    اطلاعات یک دستگاه را به صورت جدول مسطح {مسیر: [value, type, timestamp]} برمی‌گرداند.
+    با پارامتر prefix فقط زیرشاخه‌های مورد نیاز برگردانده می‌شوند.
+    """
+    return await services.get_flat_device_from_acs(device_id, prefix)
 
 
 # --- اندپوینت‌های مربوط به نمودارها ---
 
 @chart_router.get("/devices")
 def get_device_status_stats():
-    """ آمار وضعیت دستگاه‌ها را برای نمودار برمی‌گرداند """
-    return [
-        {"name": "Online", "value": 12},
-        {"name": "Offline", "value": 5},
-        {"name": "Connecting", "value": 2},
-    ]
+    """ آمار وضعیت دستگاه‌ها (Online/Offline/Stale) را از آخرین snapshot محاسبه شده برمی‌گرداند """
+    return fleet_stats.snapshot["device_status"]
+
+@chart_router.get("/models", dependencies=[Depends(dependencies.get_current_user_from_db)])
+def get_device_model_stats():
+    """ تعداد دستگاه‌ها به تفکیک مدل (ProductClass) را برمی‌گرداند """
+    return fleet_stats.snapshot["models"]
+
+@chart_router.get("/firmware", dependencies=[Depends(dependencies.get_current_user_from_db)])
+def get_device_firmware_stats():
+    """ تعداد دستگاه‌ها به تفکیک نسخه‌ی نرم‌افزار را برمی‌گرداند """
+    return fleet_stats.snapshot["firmware"]
 
 @chart_router.get("/users")
 def get_daily_active_users():
-    """ آمار کاربران فعال روزانه را برای نمودار برمی‌گرداند """
-    return [
-        {"name": "شنبه", "users": 10},
-        {"name": "یکشنبه", "users": 15},
-        {"name": "دوشنبه", "users": 8},
-        {"name": "سه‌شنبه", "users": 26},
-        {"name": "چهارشنبه", "users": 18},
-        {"name": "پنجشنبه", "users": 24},
-        {"name": "جمعه", "users": 13},
-    ]
+    """ آمار کاربران فعال روزانه (بر اساس task_logs در هفت روز گذشته) را برمی‌گرداند """
+    return fleet_stats.snapshot["daily_active_users"]
 
 @chart_router.get("/traffic")
 def get_traffic_stats():
@@ -86,13 +206,17 @@ def get_traffic_stats():
 @router.post("/tasks/change-wifi-password", status_code=status.HTTP_200_OK)
 async def task_change_wifi_password(
     request: schemas.ChangeWifiPasswordRequest,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(dependencies.get_current_user_from_db)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: schemas.User = Depends(dependencies.get_current_user_from_db),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
 ):
     """
     یک تسک برای تغییر رمز وای‌فای دستگاه در GenieACS ایجاد می‌کند.
     نیازمند دسترسی 'acs:task_wifi' است.
+    با هدر Idempotency-Key، تکرار همان درخواست (مثلاً retry فرانت‌اند یا load balancer)
+    پاسخ ذخیره شده را برمی‌گرداند و تسک دوباره‌ای در GenieACS ساخته نمی‌شود.
     """
+    task_name = "change_wifi_password"
     # پارامتر دقیق ممکن است بسته به مدل مودم شما متفاوت باشد
     # این یک نمونه رایج برای مودم‌های خانگی است
     wifi_param_path = "InternetGatewayDevice.LANDevice.1.WLANConfiguration.1.PreSharedKey.1.PreSharedKey"
@@ -105,12 +229,65 @@ async def task_change_wifi_password(
         ]
     }
 
-    if crud.check_pending_task_exists(db, device_id=request.deviceId, task_name=genieacs_task["name"]):
+    if idempotency_key:
+        # بدنه شامل رمز جدید است، پس به جای هش ساده از HMAC با کلید برنامه استفاده می‌شود
+        request_hash = hmac.new(
+            settings.SECRET_KEY.encode(), f"{task_name}|{request.model_dump_json()}".encode(), hashlib.sha256
+        ).hexdigest()
+        stored = await crud_async.claim_idempotency_key(
+            db, current_user.id, idempotency_key, request_hash, ttl=settings.IDEMPOTENCY_KEY_TTL
+        )
+        if stored is not None:
+            if stored.request_hash != request_hash:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Idempotency-Key was already used with a different request"
+                )
+            if stored.status_code is None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still being processed"
+                )
+            return JSONResponse(status_code=stored.status_code, content=stored.response)
+
+    async def _remember(status_code: int, body: Dict[str, Any]) -> None:
+        # پاسخ همراه با commit بعدی (ثبت لاگ) ذخیره می‌شود. فقط پاسخ‌های موفق و خطاهای قطعی 4xx
+        # ذخیره می‌شوند؛ برای خطای موقت (5xx، 408، 429) کلید حذف می‌شود تا تکرار درخواست دوباره اجرا شود
+        if status_code < 500 and status_code not in (408, 429):
+            if idempotency_key:
+                await crud_async.store_idempotent_response(db, current_user.id, idempotency_key, status_code, body)
+        else:
+            await _forget()
+
+    async def _forget() -> None:
+        # نتیجه‌ی درخواست معلوم نیست یا موقتی است؛ کلید حذف می‌شود (همراه با commit بعدی)
+        if idempotency_key:
+            await crud_async.delete_idempotency_key(db, current_user.id, idempotency_key)
+
+    def _log_entry(task_status: str, payload: Dict[str, Any]) -> schemas.TaskLogCreate:
+        return schemas.TaskLogCreate(
+            device_id=request.deviceId,
+            task_name=task_name,
+            status=task_status,
+            payload=payload,
+            created_by_user_id=current_user.id,
+            genieacs_task_id=genieacs_task_id
+        )
+
+    # بررسی و ثبت قفل تسک در انتظار در یک INSERT ... ON CONFLICT (همراه با ثبت کلید در همان commit)
+    acquired = await crud_async.acquire_pending_task_guards(
+        db, [request.deviceId], task_name, ttl=settings.PENDING_TASK_GUARD_TTL
+    )
+    if not acquired:
+        # نتیجه‌ی خود درخواست نیست و پس از آزاد شدن قفل، تکرار همین درخواست باید اجرا شود
+        await _forget()
+        await db.commit()
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, # کد وضعیت 409 Conflict مناسب است
             detail="یک دستور مشابه برای تغییر رمز این دستگاه در حال حاضر در صف قرار دارد."
         )
 
+    genieacs_task_id = None
     try:
         # ۱. ارسال تسک به GenieACS
         genieacs_task_id = await services.create_genieacs_task(
@@ -118,91 +295,185 @@ async def task_change_wifi_password(
             task_payload=genieacs_task
         )
 
-        # ۲. ذخیره لاگ موفقیت آمیز در دیتابیس
-        log_entry = schemas.TaskLogCreate(
-            device_id=request.deviceId,
-            task_name="change_wifi_password",
-            status="sent_to_genieacs",
-            payload=genieacs_task,
-            created_by_user_id=current_user.id,
-            genieacs_task_id=genieacs_task_id
+    except HTTPException as e:
+        # ۲. اگر خطایی در ارتباط با GenieACS رخ داد، آن را لاگ کن و قفل را آزاد کن
+        await crud_async.release_pending_task_guards(db, [(request.deviceId, task_name)])
+        await _remember(e.status_code, {"detail": e.detail})
+        await crud_async.create_task_log(db, task=_log_entry("failed", {"error": e.detail}))  # ذخیره جزئیات خطا
+        # همان خطا را به فرانت‌اند برگردان
+        raise e
+
+    except Exception as e:
+        # خطای پیش‌بینی نشده پیش از ساخته شدن تسک (مثلاً پاسخ غیر JSON از GenieACS):
+        # قفل و کلید آزاد می‌شوند تا تکرار درخواست ممکن باشد
+        await crud_async.release_pending_task_guards(db, [(request.deviceId, task_name)])
+        await _forget()
+        await crud_async.create_task_log(db, task=_log_entry("failed", {"error": f"Unexpected error: {e}"}))
+        raise
+
+    except BaseException:
+        # لغو درخواست (قطع اتصال کلاینت): معلوم نیست تسک ساخته شده یا نه، پس بدون ثبت لاگ
+        # قفل و کلید آزاد می‌شوند تا تا انقضای TTL گیر نمانند
+        await crud_async.release_pending_task_guards(db, [(request.deviceId, task_name)])
+        await _forget()
+        await db.commit()
+        raise
+
+    # ۳. تسک در GenieACS ساخته شده است؛ لاگ موفقیت آمیز (و پاسخ کلید) با یک commit ذخیره می‌شود.
+    # از اینجا به بعد قفل و کلید نباید آزاد شوند، وگرنه تکرار درخواست تسک تکراری می‌سازد
+    body = {"detail": "دستور تغییر رمز وای‌فای با موفقیت به سرور ارسال شد."}
+    try:
+        await _remember(status.HTTP_200_OK, body)
+        await crud_async.create_task_log(db, task=_log_entry("sent_to_genieacs", genieacs_task))
+    except BaseException:
+        # ثبت ناموفق بود (یا درخواست لغو شد)؛ یک بار دیگر همان نتیجه ثبت می‌شود
+        await db.rollback()
+        await _remember(status.HTTP_200_OK, body)
+        await crud_async.create_task_log(db, task=_log_entry("sent_to_genieacs", genieacs_task))
+        raise
+    return body
+
+
+@router.post(
+    "/tasks/batch",
+    response_model=List[schemas.BatchTaskResult],
+    dependencies=[Depends(dependencies.require_permission("acs:task_batch"))]
+)
+async def dispatch_batch_task(
+    request: schemas.BatchTaskRequest,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: schemas.User = Depends(dependencies.get_current_user_from_db)
+):
+    """
+    یک تسک یکسان را برای چندین دستگاه در GenieACS ایجاد می‌کند.
+    درخواست‌ها با هم‌زمانی محدود ارسال می‌شوند و تمام لاگ‌ها با یک INSERT ثبت می‌شوند.
+    نتیجه‌ی هر دستگاه جداگانه برگردانده می‌شود. نیازمند دسترسی 'acs:task_batch' است.
+    """
+    if "name" not in request.task:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Task spec must contain a 'name'")
+
+    # حذف شناسه‌های تکراری با حفظ ترتیب
+    device_ids = list(dict.fromkeys(request.deviceIds))
+    if len(device_ids) > settings.TASK_BATCH_MAX_DEVICES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.TASK_BATCH_MAX_DEVICES} devices are allowed per batch"
         )
-        crud.create_task_log(db, task=log_entry) # باید تابع crud را هم آپدیت کنید
-        return {"detail": "دستور تغییر رمز وای‌فای با موفقیت به سرور ارسال شد."}
 
-    except HTTPException as e:
-        # ۳. اگر خطایی در ارتباط با GenieACS رخ داد، آن را لاگ کن
-        log_entry = schemas.TaskLogCreate(
-            device_id=request.deviceId,
-            task_name="change_wifi_password",
-            status="failed",
-            payload={"error": e.detail}, # ذخیره جزئیات خطا
+    task_name = request.taskName or request.task["name"]
+    acquired = await crud_async.acquire_pending_task_guards(
+        db, device_ids, task_name, ttl=settings.PENDING_TASK_GUARD_TTL
+    )
+    to_send = [device_id for device_id in device_ids if device_id in acquired]
+    pending = [device_id for device_id in device_ids if device_id not in acquired]
+
+    try:
+        sent = await services.create_genieacs_tasks_bulk(
+            to_send, request.task, concurrency=settings.TASK_BATCH_CONCURRENCY
+        )
+    except BaseException:
+        # اگر ارسال دسته نیمه‌کاره ماند (مثلاً لغو درخواست)، هیچ لاگی ثبت نمی‌شود؛ قفل‌ها آزاد شوند
+        await crud_async.release_pending_task_guards(db, [(device_id, task_name) for device_id in to_send])
+        await db.commit()
+        raise
+
+    results: Dict[str, schemas.BatchTaskResult] = {
+        device_id: schemas.BatchTaskResult(
+            deviceId=device_id,
+            status="skipped_pending",
+            detail="A pending task with the same name already exists"
+        )
+        for device_id in pending
+    }
+    log_entries = []
+    for device_id, genieacs_task_id, error in sent:
+        task_status = "failed" if error else "sent_to_genieacs"
+        results[device_id] = schemas.BatchTaskResult(
+            deviceId=device_id, status=task_status, genieacs_task_id=genieacs_task_id, detail=error
+        )
+        log_entries.append(schemas.TaskLogCreate(
+            device_id=device_id,
+            task_name=task_name,
+            status=task_status,
+            payload={"error": error} if error else request.task,
             created_by_user_id=current_user.id,
             genieacs_task_id=genieacs_task_id
-        )
-        crud.create_task_log(db, task=log_entry)
-        # همان خطا را به فرانت‌اند برگردان
-        raise e
+        ))
+    # قفل هر دستگاهی که تسکش به sent_to_genieacs نرسید آزاد می‌شود (در همان commit ثبت لاگ‌ها)
+    await crud_async.release_pending_task_guards(
+        db, [(device_id, task_name) for device_id, _, error in sent if error]
+    )
+    await crud_async.bulk_create_task_logs(db, log_entries)
+
+    return [results[device_id] for device_id in device_ids]
+
     
-@router.get("/devices/{device_id}/tasks", response_model=List[schemas.TaskLog])
+@router.get("/devices/{device_id}/tasks", response_model=schemas.TaskLogPage)
 def get_device_tasks(
     device_id: str,
-    db: Session = Depends(database.get_db),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(database.get_read_db),
     # دسترسی این اندپوینت را با دسترسی مشاهده جزئیات یکی در نظر می‌گیریم
-    current_user: models.User = Depends(dependencies.get_current_user_from_db)
+    current_user: schemas.User = Depends(dependencies.get_current_user_from_db)
+):
+    """
+    تسک‌های ارسال شده برای یک دستگاه را از جدید به قدیم برمی‌گرداند.
+    برای صفحه‌ی بعد، next_cursor پاسخ را به عنوان cursor بفرستید.
+    """
+    try:
+        items, next_cursor = crud.get_task_logs_for_device(db=db, device_id=device_id, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.get("/tasks/search", response_model=schemas.TaskLogPage)
+def search_tasks(
+    task_status: Optional[str] = Query(None, alias="status"),
+    task_name: Optional[str] = None,
+    user_id: Optional[int] = None,
+    device_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(database.get_read_db)
 ):
-    """ لیست آخرین تسک‌های ارسال شده برای یک دستگاه را برمی‌گرداند. """
-    return crud.get_task_logs_for_device(db=db, device_id=device_id)
+    """
+    جستجو در تاریخچه‌ی تسک‌های تمام دستگاه‌ها بر اساس وضعیت، نام تسک، کاربر و بازه‌ی زمانی.
+    صفحه‌بندی با cursor انجام می‌شود (keyset روی created_at و id).
+    """
+    try:
+        items, next_cursor = crud.search_task_logs(
+            db, status=task_status, task_name=task_name, user_id=user_id, device_id=device_id,
+            since=since, until=until, limit=limit, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return {"items": items, "next_cursor": next_cursor}
 
 
 
 @webhook_router.post("/task-result", status_code=status.HTTP_204_NO_CONTENT)
 async def handle_genieacs_webhook(
     payload: schemas.GenieACSWebhookPayload,
-    x_webhook_secret: Optional[str] = Header(None),
-    db: Session = Depends(database.get_db)
+    x_webhook_secret: Optional[str] = Header(None)
 ):
     """
     این اندپوینت گزارش‌های ارسالی (Webhook) از GenieACS را دریافت می‌کند.
     این اندپوینت نباید محافظت شده باشد چون توسط سرور فراخوانی می‌شود.
+    گزارش فقط در صف قرار می‌گیرد و به‌روزرسانی وضعیت و ارسال WebSocket در webhook_ingest انجام می‌شود.
     """
     # قدم ۱: امن‌سازی اندپوینت
     # YOUR_VERY_SECRET_KEY باید با مقداری که در GenieACS تنظیم کرده‌اید یکسان باشد
     if x_webhook_secret != "YOUR_VERY_SECRET_KEY":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid webhook secret")
 
-    # قدم ۲: پردازش منطق
-    # پیدا کردن آخرین تسک "در انتظار" برای این دستگاه
-    task_log = db.query(models.TaskLog)\
-        .filter(models.TaskLog.device_id == payload.deviceId)\
-        .filter(models.TaskLog.status == 'sent_to_genieacs')\
-        .order_by(models.TaskLog.created_at.desc())\
-        .first()
-
-    if task_log:
-        # قدم ۳: به‌روزرسانی وضعیت تسک
-        # اگر آبجکت fault در گزارش وجود داشته باشد یعنی تسک با خطا مواجه شده
-        new_status = ""
-        if payload.fault and payload.fault.get("FaultCode"):
-            task_log.status = 'completed_fault'
-            task_log.response = {"fault": payload.fault}
-            new_status = 'completed_fault'
-        else:
-            task_log.status = 'completed_success'
-            new_status = 'completed_success'
-        
-        db.commit()
-
-                # --- بخش جدید: ارسال پیام از طریق WebSocket ---
-        update_message = {
-            "type": "TASK_UPDATE",
-            "task_id": task_log.id,
-            "new_status": new_status
-        }
-        await manager.broadcast_to_device(
-            device_id=payload.deviceId,
-            message=json.dumps(update_message)
-        )
+    # قدم ۲: قرار دادن در صف پردازش
+    # اگر صف پر باشد 503 برمی‌گردانیم تا GenieACS دوباره تلاش کند
+    if not webhook_ingestor.enqueue(payload):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Webhook queue is full")
 
     # کد وضعیت 204 No Content به GenieACS می‌گوید که ما پیام را دریافت کردیم و نیازی به پاسخ نیست
     return
@@ -210,11 +481,11 @@ async def handle_genieacs_webhook(
 @router.delete("/tasks/{task_log_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_task(
     task_log_id: int,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     # می‌توان یک دسترسی جدید 'acs:task_delete' تعریف کرد
-    current_user: models.User = Depends(dependencies.get_current_user_from_db) 
+    current_user: schemas.User = Depends(dependencies.get_current_user_from_db) 
 ):
-    task = crud.get_task_log_by_id(db, task_log_id) # باید این تابع crud را بسازید
+    task = await crud_async.get_task_log_by_id(db, task_log_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     if task.status != 'sent_to_genieacs':
@@ -223,8 +494,9 @@ async def delete_task(
     # حذف از GenieACS
     await services.delete_genieacs_task(task.device_id, task.genieacs_task_id)
     
-    # حذف از دیتابیس خودمان
-    crud.delete_task_log(db, task_log_id) # باید این تابع crud را بسازید
+    # حذف از دیتابیس خودمان و آزاد کردن قفل تسک در انتظار (با یک commit)
+    await crud_async.release_pending_task_guards(db, [(task.device_id, task.task_name)])
+    await crud_async.delete_task_log(db, task_log_id)
 
     # ارسال پیام حذف از طریق WebSocket
     update_message = {"type": "TASK_DELETE", "task_id": task_log_id}
@@ -4,8 +4,12 @@ from fastapi import APIRouter, Depends, HTTPException, status, Response
 from sqlalchemy.orm import Session
 from typing import List
 
-from .. import crud, models, schemas, database
+from .. import crud, models, schemas, database, security, services
 from .. import dependencies  # <--- وارد کردن از فایل جدید
+from ..cache import principal_cache, token_cache
+from ..webhook_ingest import webhook_ingestor
+from ..websocket_manager import manager
+from ..device_mirror import device_mirror_sync
 
 # استفاده از تابع require_permission از ماژول dependencies
 router = APIRouter(
@@ -15,7 +19,7 @@ router = APIRouter(
 )
 
 @router.get("/users/", response_model=List[schemas.User])
-def read_all_users(db: Session = Depends(database.get_db)):
+def read_all_users(db: Session = Depends(database.get_read_db)):
     """ لیستی از تمام کاربران سیستم را برمی‌گرداند """
     # توجه: نیازی به تکرار وابستگی دسترسی در اینجا نیست
     return crud.get_users(db)
@@ -40,7 +44,7 @@ def create_new_permission(permission: schemas.PermissionCreate, db: Session = De
     return crud.create_permission(db, permission=permission)
 
 @router.get("/permissions/", response_model=List[schemas.Permission])
-def read_all_permissions(db: Session = Depends(database.get_db)):
+def read_all_permissions(db: Session = Depends(database.get_read_db)):
     """ لیست تمام دسترسی‌های تعریف‌شده در سیستم را برمی‌گرداند """
     return crud.get_permissions(db)
 
@@ -74,4 +78,45 @@ def update_password_for_user(user_id: int, password_update: schemas.UserPassword
     user = crud.update_user_password(db, user_id=user_id, new_password=password_update.new_password)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    return user
\ No newline at end of file
+    return user
+
+@router.get("/cache/stats")
+def read_cache_stats():
+    """ آمار hit/miss و اندازه‌ی کش‌های دستگاه و کاربر را برمی‌گرداند """
+    return services.get_cache_stats() + [principal_cache.stats(), token_cache.stats()]
+
+
+@router.get("/webhook/metrics")
+def read_webhook_metrics():
+    """ عمق صف، تأخیر و شمارنده‌های پردازش وب‌هوک‌ها را برمی‌گرداند """
+    return webhook_ingestor.metrics()
+
+
+@router.get("/websocket/stats")
+def read_websocket_stats():
+    """ تعداد اتصال‌های WebSocket و پیام‌های دور ریخته شده برای کلاینت‌های کند را برمی‌گرداند """
+    return manager.stats()
+
+
+@router.get("/db/metrics")
+def read_db_metrics():
+    """ وضعیت استخرهای اتصال پایگاه داده و زمان انتظار برای گرفتن اتصال را برمی‌گرداند """
+    return database.get_pool_metrics()
+
+
+@router.get("/acs/status")
+def read_acs_client_status():
+    """ وضعیت circuit breaker و کلاینت HTTP مربوط به GenieACS را برمی‌گرداند """
+    return services.client.stats()
+
+
+@router.get("/auth/hash-pool")
+def read_password_hash_pool_stats():
+    """ تعداد هش‌های bcrypt در حال اجرا، ظرفیت و درخواست‌های رد شده را برمی‌گرداند """
+    return security.password_hasher.stats()
+
+
+@router.get("/devices/mirror/status")
+def read_device_mirror_status():
+    """ زمان آخرین همگام‌سازی، high-water mark و وضعیت ایندکس جستجوی دستگاه‌ها را برمی‌گرداند """
+    return device_mirror_sync.stats()
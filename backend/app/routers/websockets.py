@@ -16,4 +16,7 @@ async def websocket_endpoint(websocket: WebSocket, device_id: str):
             # منتظر پیام از کلاینت (در این سناریو نیازی نیست)
             await websocket.receive_text()
     except WebSocketDisconnect:
+        pass
+    finally:
+        # اگر اتصال قبلاً به دلیل کندی کنار گذاشته شده باشد، disconnect کاری انجام نمی‌دهد
         manager.disconnect(websocket, device_id)
\ No newline at end of file
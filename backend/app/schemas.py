@@ -52,6 +52,20 @@ class ChangeWifiPasswordRequest(BaseModel):
     deviceId: str
     newPassword: str
 
+# درخواست ارسال یک تسک یکسان به چندین دستگاه
+class BatchTaskRequest(BaseModel):
+    deviceIds: List[str] = Field(..., min_length=1)
+    # تعریف تسک GenieACS، مثلاً {"name": "reboot"} یا {"name": "setParameterValues", "parameterValues": [...]}
+    task: Dict[str, Any]
+    # نامی که در task_logs ثبت می‌شود؛ پیش‌فرض همان task["name"] است
+    taskName: Optional[str] = None
+
+class BatchTaskResult(BaseModel):
+    deviceId: str
+    status: str  # "sent_to_genieacs" | "failed" | "skipped_pending"
+    genieacs_task_id: Optional[str] = None
+    detail: Optional[str] = None
+
 class TaskLogUser(BaseModel):
     id: int
     username: str
@@ -75,8 +89,39 @@ class TaskLog(TaskLogBase):
     class Config:
         from_attributes = True
 
+# یک صفحه از لاگ‌های تسک؛ next_cursor برای درخواست صفحه‌ی بعد (در صورت وجود)
+class TaskLogPage(BaseModel):
+    items: List[TaskLog]
+    next_cursor: Optional[str] = None
+
+# خلاصه‌ی یک دستگاه در ایندکس محلی جستجو
+class DeviceSummary(BaseModel):
+    id: str
+    serial: Optional[str] = None
+    oui: Optional[str] = None
+    product_class: Optional[str] = None
+    software_version: Optional[str] = None
+    wan_ip: Optional[str] = None
+    pppoe_user: Optional[str] = None
+    last_inform: Optional[str] = None
+
+class DeviceSearchResult(BaseModel):
+    items: List[DeviceSummary]
+    # زمان آخرین به‌روزرسانی ایندکس؛ نتایج تا این لحظه معتبرند
+    indexed_at: Optional[datetime] = None
+    total_indexed: int
+
+class DeviceMirrorPage(BaseModel):
+    items: List[DeviceSummary]
+    total: int
+    # زمان آخرین همگام‌سازی موفق آینه با GenieACS
+    synced_at: Optional[datetime] = None
+
 # یک اسکیمای ساده برای داده‌های ورودی از وب‌هوک
 class GenieACSWebhookPayload(BaseModel):
     deviceId: str
+    # شناسه‌ی تسک در GenieACS (همان genieacs_task_id ذخیره شده در task_logs)
+    # در صورت وجود، لاگ تسک مستقیماً با همین شناسه پیدا می‌شود
+    taskId: Optional[str] = None
     fault: Optional[Dict[str, Any]] = None
     # ... سایر فیلدهایی که از GenieACS ارسال می‌کنید
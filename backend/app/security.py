@@ -1,5 +1,9 @@
 # app/security.py
 
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
@@ -23,13 +27,79 @@ def get_password_hash(password: str) -> str:
     """تبدیل رمز عبور ساده به هش"""
     return pwd_context.hash(password)
 
+
+class PasswordHashBusy(Exception):
+    """ تعداد عملیات هش در حال اجرا و در صف به سقف رسیده است. """
+
+
+class PasswordHasher:
+    """
+    اجرای bcrypt در یک thread pool جدا تا حلقه‌ی رویداد مسدود نشود (bcrypt هنگام هش GIL را آزاد می‌کند).
+    حداکثر max_workers هش هم‌زمان اجرا و حداکثر queue_size هش دیگر منتظر می‌مانند؛
+    بیش از آن درخواست با PasswordHashBusy رد می‌شود.
+    """
+
+    def __init__(self, max_workers: int, queue_size: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self.capacity = max_workers + queue_size
+        self.in_flight = 0
+        self.rejected = 0
+        # میانگین متحرک مدت verify؛ برای شبیه‌سازی زمان پاسخ نام کاربری ناموجود
+        self.verify_seconds = 0.2
+
+    async def _run(self, func, *args):
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            raise PasswordHashBusy()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        started = time.perf_counter()
+        result = await self._run(verify_password, plain_password, hashed_password)
+        self.verify_seconds = 0.9 * self.verify_seconds + 0.1 * (time.perf_counter() - started)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def reject_unknown_user(self) -> None:
+        """
+        برای نام کاربری ناموجود هشی محاسبه نمی‌شود، اما پاسخ به اندازه‌ی یک verify معمولی
+        (با کمی jitter) به تأخیر می‌افتد تا وجود نام کاربری از روی زمان پاسخ قابل تشخیص نباشد.
+        """
+        await asyncio.sleep(self.verify_seconds * random.uniform(0.9, 1.1))
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "capacity": self.capacity,
+            "rejected": self.rejected,
+            "avg_verify_ms": round(self.verify_seconds * 1000, 1),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# یک نمونه از اجرا‌کننده‌ی هش می‌سازیم تا در کل برنامه قابل استفاده باشد
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    queue_size=settings.PASSWORD_HASH_QUEUE_SIZE,
+)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """ایجاد توکن دسترسی JWT"""
     to_encode = data.copy()
+    now = datetime.now(timezone.utc)
     if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+        expire = now + timedelta(minutes=15)
+    # iat بخشی از کلید کش کاربر در dependencies است
+    to_encode.update({"exp": expire, "iat": now})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
\ No newline at end of file
@@ -1,49 +1,182 @@
-import httpx, json
-from typing import List, Dict, Any
+import asyncio, hashlib, httpx, json, logging, zlib
+import orjson
+from functools import lru_cache
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from fastapi import HTTPException, status
 from pathlib import Path
 
 # وارد کردن تنظیمات از فایل config
 from .config import settings
+from .cache import TTLCache
+from .acs_client import AcsClient
 
 DATA_PATH_All = Path(__file__).parent.parent / "modems.json"
 DATA_PATH_MODEM1 = Path(__file__).parent.parent / "modem1.json"
 
 
-# تعریف یک کلاینت httpx که در کل برنامه استفاده شود برای بهینه‌سازی
-client = httpx.AsyncClient()
-
-async def get_all_devices_from_acs() -> List[Dict[str, Any]]:
-    """ لیستی از تمام دستگاه‌ها را از ACSServer دریافت می‌کند. """
+logger = logging.getLogger(__name__)
+
+# کلاینت مدیریت‌شده‌ی GenieACS (استخر اتصال، تلاش مجدد و circuit breaker)؛ در startup برنامه ساخته می‌شود
+client = AcsClient()
+
+# آخرین پاسخ موفق ACS برای هر درخواست؛ وقتی ACS در دسترس نیست همین برگردانده می‌شود
+last_known_good = TTLCache(
+    "acs_last_known_good",
+    maxsize=settings.ACS_LAST_KNOWN_GOOD_MAX_ENTRIES,
+    ttl=float("inf"),
+)
+
+# کش لیست دستگاه‌ها (کلید: پارامترهای کوئری) و جزئیات هر دستگاه (کلید: device_id)
+device_list_cache = TTLCache(
+    "device_list",
+    maxsize=settings.DEVICE_CACHE_MAX_ENTRIES,
+    ttl=settings.DEVICE_LIST_CACHE_TTL,
+    stale_ttl=settings.DEVICE_CACHE_STALE_TTL,
+)
+device_detail_cache = TTLCache(
+    "device_detail",
+    maxsize=settings.DEVICE_CACHE_MAX_ENTRIES,
+    ttl=settings.DEVICE_DETAIL_CACHE_TTL,
+    stale_ttl=settings.DEVICE_CACHE_STALE_TTL,
+)
+
+def _build_devices_params(
+    query: Optional[str] = None,
+    projection: Optional[str] = None,
+    skip: Optional[int] = None,
+    limit: Optional[int] = None,
+    sort: Optional[str] = None,
+) -> Dict[str, str]:
+    """ پارامترهای کوئری NBI گنی‌ای‌سی‌اس را برای /devices می‌سازد و JSON ورودی را اعتبارسنجی می‌کند. """
+    params: Dict[str, str] = {}
+    for name, raw in (("query", query), ("sort", sort)):
+        if raw is None:
+            continue
+        try:
+            json.loads(raw)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Parameter '{name}' must be a valid JSON object"
+            )
+        params[name] = raw
+    if projection:
+        params["projection"] = projection
+    if skip:
+        params["skip"] = str(skip)
+    if limit is not None:
+        params["limit"] = str(limit)
+    return params
+
+
+@lru_cache(maxsize=None)
+def _load_fixture(path: Path) -> Any:
+    """ فایل داده‌ی آزمایشی را فقط یک بار از دیسک می‌خواند. """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _load_mock_devices(params: Dict[str, str], skip: Optional[int] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    وقتی ACS در دسترس نیست: آخرین پاسخ موفق همین درخواست، و اگر نبود
+    داده‌ی آزمایشی modems.json را با همان skip/limit برمی‌گرداند.
+    """
+    cached = last_known_good.get(("devices", tuple(sorted(params.items()))))
+    if cached is not None:
+        return cached
+    devices = _load_fixture(DATA_PATH_All)
+    start = skip or 0
+    end = start + limit if limit is not None else None
+    return devices[start:end]
+
+
+def _load_mock_device(device_id: str, projection: Optional[str] = None) -> Dict[str, Any]:
+    """ آخرین اطلاعات موفق دستگاه، و اگر نبود داده‌ی آزمایشی modem1.json را برمی‌گرداند. """
+    cached = last_known_good.get(("device", device_id, projection))
+    if cached is not None:
+        return cached
+    return _load_fixture(DATA_PATH_MODEM1)
+
+
+async def get_all_devices_from_acs(
+    query: Optional[str] = None,
+    projection: Optional[str] = None,
+    skip: Optional[int] = None,
+    limit: Optional[int] = None,
+    sort: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    لیست دستگاه‌ها را از ACSServer دریافت می‌کند.
+    پارامترهای query، projection، skip، limit و sort مستقیماً به GenieACS فرستاده می‌شوند
+    تا فقط ستون‌ها و صفحه‌ی مورد نیاز منتقل شود.
+    """
+    params = _build_devices_params(query, projection, skip, limit, sort)
+    cache_key = tuple(sorted(params.items()))
+    return await device_list_cache.get_or_load(
+        cache_key, lambda: _fetch_devices_from_acs(params, skip, limit)
+    )
+
+
+async def get_all_devices_raw_from_acs(
+    query: Optional[str] = None,
+    projection: Optional[str] = None,
+    skip: Optional[int] = None,
+    limit: Optional[int] = None,
+    sort: Optional[str] = None,
+) -> bytes:
+    """
+    مانند get_all_devices_from_acs، اما بدنه‌ی پاسخ GenieACS را بدون decode و اعتبارسنجی
+    (به صورت bytes) برمی‌گرداند تا مستقیماً به کلاینت فرستاده شود. کش هم bytes نگه می‌دارد
+    که بسیار کم‌حجم‌تر از آبجکت‌های پایتون است.
+    """
+    params = _build_devices_params(query, projection, skip, limit, sort)
+    cache_key = ("raw",) + tuple(sorted(params.items()))
+    return await device_list_cache.get_or_load(
+        cache_key, lambda: _fetch_devices_raw_from_acs(params, skip, limit)
+    )
+
+
+async def _fetch_devices_raw_from_acs(
+    params: Dict[str, str], skip: Optional[int], limit: Optional[int]
+) -> bytes:
+    """ درخواست واقعی /devices به ACSServer که بدنه‌ی خام پاسخ را برمی‌گرداند (بدون کش). """
+    fallback_key = ("devices_raw", tuple(sorted(params.items())))
+    try:
+        response = await client.get(f"{settings.ACSSERVER_URL}/devices", params=params, timeout=3.0)
+        response.raise_for_status()
+    except (httpx.HTTPStatusError, httpx.RequestError):
+        # fallback: آخرین پاسخ خام موفق، و اگر نبود داده‌ی آزمایشی
+        cached = last_known_good.get(fallback_key)
+        if cached is not None:
+            return cached
+        return orjson.dumps(_load_mock_devices(params, skip, limit))
+    body = response.content
+    last_known_good.set(fallback_key, body)
+    return body
+
+
+async def _fetch_devices_from_acs(
+    params: Dict[str, str], skip: Optional[int], limit: Optional[int]
+) -> List[Dict[str, Any]]:
+    """ درخواست واقعی /devices به ACSServer (بدون کش). """
     try:
-
-
-
-
-    #    with open(DATA_PATH_All, "r", encoding="utf-8") as f:
-    #        return json.load(f)
-
-
-
-
-
-
         # استفاده از آدرس تعریف شده در فایل .env
         url = f"{settings.ACSSERVER_URL}/devices"
         
         # ارسال درخواست GET
-        response = await client.get(url, timeout=3.0)
+        response = await client.get(url, params=params, timeout=3.0)
         
         # اگر درخواست ناموفق بود (مثلاً خطای 4xx یا 5xx)، یک خطا ایجاد کن
         response.raise_for_status()
         
         # نتیجه را به صورت JSON برگردان
-        return response.json()
+        devices = response.json()
+        last_known_good.set(("devices", tuple(sorted(params.items()))), devices)
+        return devices
 
     except httpx.HTTPStatusError as e:
 
-        with open(DATA_PATH_All, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _load_mock_devices(params, skip, limit)
 
         # اگر خطای HTTP رخ داد، آن را به یک خطای قابل فهم برای کاربر تبدیل کن
         raise HTTPException(
@@ -52,8 +185,7 @@ async def get_all_devices_from_acs() -> List[Dict[str, Any]]:
         )
     except httpx.RequestError as e:
     # fallback به mock
-        with open(DATA_PATH_All, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _load_mock_devices(params, skip, limit)
         
         # اگر مشکل در اتصال بود (مثلاً سرور خاموش بود)
         raise HTTPException(
@@ -61,19 +193,146 @@ async def get_all_devices_from_acs() -> List[Dict[str, Any]]:
             detail=f"Could not connect to ACSServer service: {e}"
         )
 
-async def get_device_details_from_acs(device_id: str) -> Dict[str, Any]:
-    """ اطلاعات کامل یک دستگاه خاص را با استفاده از ID آن (که معمولاً Serial Number است) دریافت می‌کند. """
+def _export_query(query: Optional[str], after: Optional[str]) -> Optional[str]:
+    """ فیلتر کاربر را با شرط keyset روی _id (ادامه از بعد از after) ترکیب می‌کند. """
+    conditions = []
+    if query:
+        conditions.append(json.loads(query))
+    if after:
+        conditions.append({"_id": {"$gt": after}})
+    if not conditions:
+        return None
+    return json.dumps(conditions[0] if len(conditions) == 1 else {"$and": conditions})
+
+
+async def iter_device_pages_after(
+    projection: Optional[str] = None,
+    query: Optional[str] = None,
+    after: Optional[str] = None,
+    page_size: int = 500,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    دستگاه‌ها را به ترتیب _id و صفحه به صفحه با شرط «_id بزرگ‌تر از آخرین شناسه» می‌خواند
+    (به جای skip)، پس با تغییر ناوگان در حین خواندن صفحه‌ای جا نمی‌افتد و از هر شناسه‌ای
+    می‌توان ادامه داد. برخلاف بقیه‌ی توابع، خطای ACS به داده‌ی آزمایشی برنمی‌گردد و raise می‌شود.
+    """
+    if projection and "_id" not in projection.split(","):
+        projection = f"_id,{projection}"
+    while True:
+        params = _build_devices_params(_export_query(query, after), projection, None, page_size, '{"_id": 1}')
+        response = await client.get(
+            f"{settings.ACSSERVER_URL}/devices", params=params, timeout=settings.FLEET_EXPORT_PAGE_TIMEOUT
+        )
+        response.raise_for_status()
+        page = response.json()
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        after = page[-1]["_id"]
+
+
+def export_devices_ndjson(
+    query: Optional[str] = None,
+    projection: Optional[str] = None,
+    after: Optional[str] = None,
+    page_size: int = 500,
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    خروجی NDJSON (هر خط یک دستگاه) از کل ناوگان، با gzip اختیاری.
+    ورودی‌ها همین‌جا (پیش از شروع پاسخ) اعتبارسنجی می‌شوند. صفحه‌ی بعدی در پس‌زمینه خوانده
+    می‌شود در حالی که صفحه‌ی فعلی ارسال می‌شود و حداکثر یک صفحه در صف می‌ماند، پس حافظه
+    مستقل از اندازه‌ی ناوگان است. اگر ACS وسط کار خطا دهد، آخرین خط
+    {"_error": ..., "_resume_after": آخرین _id} است تا کلاینت با after ادامه دهد.
+    """
+    _build_devices_params(query=query)
+
+    async def _produce(queue: asyncio.Queue):
+        # پایان با None و خطا با خود exception به مصرف‌کننده اعلام می‌شود
+        try:
+            async for page in iter_device_pages_after(projection, query, after, page_size):
+                await queue.put(page)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
+
+    async def _stream() -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        producer = asyncio.create_task(_produce(queue))
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        last_id = after
+        try:
+            while (item := await queue.get()) is not None:
+                if isinstance(item, (httpx.HTTPStatusError, httpx.RequestError)):
+                    logger.warning("Fleet export interrupted after %s: %s", last_id, item)
+                    chunk = orjson.dumps({"_error": str(item), "_resume_after": last_id}) + b"\n"
+                    yield compressor.compress(chunk) if compressor else chunk
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                chunk = b"".join(orjson.dumps(device) + b"\n" for device in item)
+                last_id = item[-1].get("_id", last_id)
+                yield compressor.compress(chunk) if compressor else chunk
+            if compressor:
+                yield compressor.flush()
+        finally:
+            producer.cancel()
+
+    return _stream()
+
+
+async def get_device_details_from_acs(device_id: str, projection: Optional[str] = None) -> Dict[str, Any]:
+    """
+    اطلاعات یک دستگاه خاص را با استفاده از ID آن (که معمولاً Serial Number است) دریافت می‌کند.
+    اگر projection (مسیرها با کاما) داده شود فقط همان پارامترها از GenieACS خوانده می‌شوند.
+    """
+    return await device_detail_cache.get_or_load(
+        (device_id, projection), lambda: _fetch_device_details_from_acs(device_id, projection)
+    )
+
+
+def invalidate_device(device_id: str):
+    """ ورودی‌های کش یک دستگاه (با هر projection) را حذف می‌کند تا درخواست بعدی داده‌ی تازه بگیرد. """
+    device_detail_cache.invalidate_matching(lambda key, _: key[0] == device_id)
+
+
+def device_etag(device: Dict[str, Any], projection: Optional[str] = None) -> str:
+    """
+    ETag ضعیف برای جزئیات دستگاه. پارامترهای دستگاه فقط در جلسه‌ی inform تغییر می‌کنند، پس
+    (_id، _lastInform، projection) کافی است؛ اگر _lastInform نباشد از هش محتوا استفاده می‌شود.
+    """
+    if device.get("_lastInform"):
+        basis = f"{device.get('_id')}|{device['_lastInform']}|{projection or ''}"
+    else:
+        basis = json.dumps(device, sort_keys=True, default=str)
+    return f'W/"{hashlib.sha1(basis.encode()).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """ آیا هدر If-None-Match شامل همین ETag (با مقایسه‌ی ضعیف) یا * است. """
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def get_cache_stats() -> List[Dict[str, Any]]:
+    """ آمار hit/miss کش‌های دستگاه را برای تنظیم اندازه‌ی آن‌ها برمی‌گرداند. """
+    return [device_list_cache.stats(), device_detail_cache.stats(), last_known_good.stats()]
+
+
+async def _fetch_device_details_from_acs(device_id: str, projection: Optional[str] = None) -> Dict[str, Any]:
+    """ درخواست واقعی جزئیات دستگاه به ACSServer (بدون کش). """
     try:
-
-
-
-
-     #   with open(DATA_PATH_MODEM1, "r", encoding="utf-8") as g:
-     #      return json.load(g)
-        
-
-
-        
         # در ACSServer برای پیدا کردن با ID باید از کوئری استفاده کرد
         # ID دستگاه باید در URL انکود شود تا کاراکترهای خاص مشکلی ایجاد نکنند
         from urllib.parse import quote
@@ -81,6 +340,9 @@ async def get_device_details_from_acs(device_id: str) -> Dict[str, Any]:
         encoded_query = quote(query)
         
         url = f"{settings.ACSSERVER_URL}/devices/?query={encoded_query}"
+        if projection:
+            # _id و _lastInform همیشه لازم‌اند (شناسه و ETag)
+            url += f"&projection={quote(','.join(['_id', '_lastInform', projection]))}"
         
         response = await client.get(url, timeout=3.0)
         response.raise_for_status()
@@ -91,12 +353,12 @@ async def get_device_details_from_acs(device_id: str) -> Dict[str, Any]:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found in ACSServer")
         
         # اولین دستگاه پیدا شده را برمی‌گردانیم
+        last_known_good.set(("device", device_id, projection), devices[0])
         return devices[0]
 
     except httpx.HTTPStatusError as e:
 
-        with open(DATA_PATH_MODEM1, "r", encoding="utf-8") as g:
-            return json.load(g)
+        return _load_mock_device(device_id, projection)
 
         raise HTTPException(
             status_code=e.response.status_code,
@@ -104,8 +366,7 @@ async def get_device_details_from_acs(device_id: str) -> Dict[str, Any]:
         )
     except httpx.RequestError as e:
 
-        with open(DATA_PATH_MODEM1, "r", encoding="utf-8") as g:
-            return json.load(g)
+        return _load_mock_device(device_id, projection)
 
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -114,6 +375,62 @@ async def get_device_details_from_acs(device_id: str) -> Dict[str, Any]:
     
     
 
+def _path_selected(path: str, prefixes: Optional[List[str]]) -> bool:
+    """ مسیر انتخاب شده است اگر زیرمجموعه‌ی یکی از پیشوندها یا والد یکی از آن‌ها باشد. """
+    if not prefixes:
+        return True
+    for prefix in prefixes:
+        if path == prefix or path.startswith(prefix + ".") or prefix.startswith(path + "."):
+            return True
+    return False
+
+
+def flatten_device(device: Dict[str, Any], prefixes: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+    """
+    درخت تو در توی یک دستگاه GenieACS را به جدول {مسیر: [value, type, timestamp]} تبدیل می‌کند.
+    فیلدهای متا مانند _id و _lastInform و _deviceId._SerialNumber هم با type و timestamp خالی می‌آیند.
+    اگر prefixes داده شود فقط مسیرهای زیر آن پیشوندها پیمایش می‌شوند.
+    """
+    prefixes = [prefix.rstrip(".") for prefix in prefixes or [] if prefix]
+    flat: Dict[str, List[Any]] = {}
+
+    def _walk(node: Dict[str, Any], path: str):
+        if "_value" in node:
+            if _path_selected(path, prefixes) and not any(prefix.startswith(path + ".") for prefix in prefixes):
+                flat[path] = [node["_value"], node.get("_type"), node.get("_timestamp")]
+            return
+        for key, child in node.items():
+            if key.startswith("_") or not isinstance(child, dict):
+                continue
+            child_path = f"{path}.{key}" if path else key
+            if _path_selected(child_path, prefixes):
+                _walk(child, child_path)
+
+    for key, value in device.items():
+        if not key.startswith("_"):
+            continue
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                meta_path = f"{key}.{sub_key}"
+                if _path_selected(meta_path, prefixes) and not isinstance(sub_value, dict):
+                    flat[meta_path] = [sub_value, None, None]
+        elif _path_selected(key, prefixes):
+            flat[key] = [value, None, None]
+
+    _walk(device, "")
+    return flat
+
+
+async def get_flat_device_from_acs(device_id: str, prefixes: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    دستگاه را (از کش یا ACS) گرفته و به شکل مسطح و فیلتر شده برمی‌گرداند.
+    پیشوندها به عنوان projection به GenieACS داده می‌شوند تا فقط همان زیرشاخه‌ها خوانده شوند.
+    """
+    selected = sorted({prefix.rstrip(".") for prefix in prefixes or [] if prefix.rstrip(".")})
+    device = await get_device_details_from_acs(device_id, ",".join(selected) or None)
+    return {"_id": device.get("_id", device_id), "parameters": flatten_device(device, prefixes)}
+
+
 async def create_genieacs_task(device_id: str, task_payload: Dict[str, Any]) -> str:
     """ یک تسک جدید برای یک دستگاه در GenieACS ایجاد می‌کند. """
     url = f"{settings.ACSSERVER_URL}/devices/{device_id}/tasks"
@@ -139,6 +456,29 @@ async def create_genieacs_task(device_id: str, task_payload: Dict[str, Any]) ->
         )
 
 
+
+async def create_genieacs_tasks_bulk(
+    device_ids: List[str], task_payload: Dict[str, Any], concurrency: int
+) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    یک تسک را با حداکثر `concurrency` درخواست هم‌زمان برای چند دستگاه در GenieACS ایجاد می‌کند.
+    برای هر دستگاه (device_id, genieacs_task_id, خطا) برمی‌گرداند؛ خطای یک دستگاه
+    (از جمله پاسخ نامعتبر ACS) فقط نتیجه‌ی همان دستگاه را ناموفق می‌کند.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _create_one(device_id: str):
+        async with semaphore:
+            try:
+                return device_id, await create_genieacs_task(device_id, task_payload), None
+            except HTTPException as e:
+                return device_id, None, str(e.detail)
+            except Exception as e:
+                logger.exception("Creating task for device %s failed", device_id)
+                return device_id, None, f"Unexpected error: {e}"
+
+    return await asyncio.gather(*(_create_one(device_id) for device_id in device_ids))
+
     
 async def delete_genieacs_task(device_id: str, genieacs_task_id: str):
     """ یک تسک را از صف GenieACS حذف می‌کند. """
@@ -0,0 +1,199 @@
+# app/webhook_ingest.py
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import crud_async, schemas, services
+from .config import settings
+from .database import AsyncSessionLocal
+from .websocket_manager import manager
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookIngestor:
+    """
+    صف درون‌پردازه‌ای برای وب‌هوک‌های نتیجه‌ی تسک GenieACS.
+    اندپوینت فقط پیام را در صف می‌گذارد و فوراً پاسخ می‌دهد؛ یک worker پیام‌ها را
+    دسته‌ای برمی‌دارد، وضعیت‌ها را با UPDATE گروهی ثبت می‌کند و پس از commit
+    پیام‌های WebSocket را ارسال می‌کند.
+    """
+
+    def __init__(self, maxsize: int, batch_size: int, batch_wait: float, retry_attempts: int, retry_backoff: float):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.retry_attempts = retry_attempts
+        self.retry_backoff = retry_backoff
+        self._queue: "asyncio.Queue[Tuple[schemas.GenieACSWebhookPayload, float]]" = asyncio.Queue(maxsize=maxsize)
+        self._worker: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def enqueue(self, payload: schemas.GenieACSWebhookPayload) -> bool:
+        """ پیام را در صف می‌گذارد؛ اگر صف پر باشد False برمی‌گرداند. """
+        try:
+            self._queue.put_nowait((payload, time.monotonic()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def start(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """ پیام‌های باقی‌مانده را پردازش می‌کند و worker را متوقف می‌کند. """
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        while not self._queue.empty():
+            await self._process_with_retry(self._drain_nowait([]))
+
+    def _drain_nowait(self, batch: List[Tuple[schemas.GenieACSWebhookPayload, float]]):
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _next_batch(self) -> List[Tuple[schemas.GenieACSWebhookPayload, float]]:
+        # منتظر اولین پیام می‌مانیم، سپس تا batch_wait ثانیه برای پر شدن دسته صبر می‌کنیم
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            self._drain_nowait(batch)
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.batch_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            await self._process_with_retry(batch)
+
+    async def _process_with_retry(self, batch: List[Tuple[schemas.GenieACSWebhookPayload, float]]) -> None:
+        """
+        دسته را پردازش می‌کند و در صورت خطا با backoff نمایی دوباره تلاش می‌کند. تکرار بی‌خطر است،
+        چون فقط تسک‌هایی که هنوز در انتظارند به‌روز می‌شوند. در این مدت صف پر می‌شود و اندپوینت
+        با 503 از GenieACS می‌خواهد وب‌هوک‌های جدید را بعداً دوباره بفرستد.
+        """
+        attempts = max(1, self.retry_attempts)
+        for attempt in range(attempts):
+            try:
+                await self._process_batch(batch)
+                return
+            except Exception:
+                if attempt == attempts - 1:
+                    self.failed += len(batch)
+                    logger.exception(
+                        "Dropping webhook batch of %d items after %d attempts: %s",
+                        len(batch), attempts,
+                        ", ".join(f"{payload.deviceId}/{payload.taskId or '-'}" for payload, _ in batch),
+                    )
+                    return
+                self.retries += 1
+                delay = self.retry_backoff * (2 ** attempt)
+                logger.warning(
+                    "Webhook batch of %d items failed (attempt %d/%d), retrying in %.1fs",
+                    len(batch), attempt + 1, attempts, delay, exc_info=True,
+                )
+                await asyncio.sleep(delay)
+
+    async def _process_batch(self, batch: List[Tuple[schemas.GenieACSWebhookPayload, float]]) -> None:
+        if not batch:
+            return
+        device_ids = list({payload.deviceId for payload, _ in batch})
+        task_ids = [payload.taskId for payload, _ in batch if payload.taskId]
+        # گزارش‌های قدیمی بدون taskId با آخرین تسک در انتظار دستگاه تطبیق داده می‌شوند
+        legacy_device_ids = list({payload.deviceId for payload, _ in batch if not payload.taskId})
+        updates: List[Dict[str, Any]] = []
+        messages: List[Tuple[str, Dict[str, Any]]] = []
+        completed: List[Tuple[str, str]] = []
+
+        async with AsyncSessionLocal() as db:
+            by_task_id = await crud_async.get_pending_task_logs_by_genieacs_ids(db, task_ids) if task_ids else {}
+            # تسک‌های در انتظار هر دستگاه، از جدیدترین به قدیمی‌ترین
+            pending = await crud_async.get_pending_task_logs_for_devices(db, legacy_device_ids) if legacy_device_ids else {}
+            for payload, _ in batch:
+                if payload.taskId:
+                    task_log = by_task_id.pop(payload.taskId, None)
+                else:
+                    candidates = pending.get(payload.deviceId)
+                    task_log = candidates.pop(0) if candidates else None
+                if task_log is None:
+                    continue
+                # اگر آبجکت fault در گزارش وجود داشته باشد یعنی تسک با خطا مواجه شده
+                if payload.fault and payload.fault.get("FaultCode"):
+                    new_status = 'completed_fault'
+                    updates.append({"id": task_log.id, "status": new_status, "response": {"fault": payload.fault}})
+                else:
+                    new_status = 'completed_success'
+                    updates.append({"id": task_log.id, "status": new_status})
+                completed.append((task_log.device_id, task_log.task_name))
+                messages.append((payload.deviceId, {
+                    "type": "TASK_UPDATE",
+                    "task_id": task_log.id,
+                    "new_status": new_status
+                }))
+            # قفل «تسک در انتظار» تسک‌های تمام شده در همان commit به‌روزرسانی وضعیت آزاد می‌شود
+            await crud_async.release_pending_task_guards(db, completed)
+            await crud_async.bulk_update_task_statuses(db, updates)
+
+        # پس از commit: پاک کردن کش دستگاه‌ها و ارسال پیام‌ها از طریق WebSocket
+        for device_id in device_ids:
+            services.invalidate_device(device_id)
+        for device_id, message in messages:
+            await manager.broadcast_to_device(device_id=device_id, message=json.dumps(message))
+
+        now = time.monotonic()
+        self.last_lag = max(now - enqueued_at for _, enqueued_at in batch)
+        self.max_lag = max(self.max_lag, self.last_lag)
+        self.processed += len(batch)
+        self.batches += 1
+        self.last_batch_size = len(batch)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_maxsize": self._queue.maxsize,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+            "last_lag_seconds": round(self.last_lag, 4),
+            "max_lag_seconds": round(self.max_lag, 4),
+            "worker_running": self._worker is not None and not self._worker.done(),
+        }
+
+
+# یک نمونه از صف وب‌هوک می‌سازیم تا در کل برنامه قابل استفاده باشد
+webhook_ingestor = WebhookIngestor(
+    maxsize=settings.WEBHOOK_QUEUE_MAX_SIZE,
+    batch_size=settings.WEBHOOK_BATCH_SIZE,
+    batch_wait=settings.WEBHOOK_BATCH_WAIT,
+    retry_attempts=settings.WEBHOOK_RETRY_ATTEMPTS,
+    retry_backoff=settings.WEBHOOK_RETRY_BACKOFF,
+)
@@ -1,28 +1,126 @@
 # app/websocket_manager.py
+import asyncio
 from fastapi import WebSocket
-from typing import Dict, List
+from typing import Any, Dict, Optional
+
+from .broadcast import BroadcastBackend, InMemoryBroadcastBackend, create_broadcast_backend
+from .config import settings
+
+
+class _Subscriber:
+    """ یک اتصال WebSocket به همراه صف ارسال محدود و task نویسنده‌ی اختصاصی آن """
+
+    def __init__(self, websocket: WebSocket, device_id: str, queue_size: int):
+        self.websocket = websocket
+        self.device_id = device_id
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+
 
 class ConnectionManager:
-    def __init__(self):
-        # ساختار: { "device_id_1": [websocket1, websocket2], "device_id_2": [websocket3] }
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    def __init__(
+        self,
+        queue_size: int = settings.WS_SEND_QUEUE_SIZE,
+        send_timeout: float = settings.WS_SEND_TIMEOUT,
+        slow_consumer_policy: str = settings.WS_SLOW_CONSUMER_POLICY,
+        backend: Optional[BroadcastBackend] = None,
+    ):
+        # ساختار: { "device_id_1": {websocket1: subscriber1, websocket2: subscriber2}, ... }
+        self.active_connections: Dict[str, Dict[WebSocket, _Subscriber]] = {}
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_consumer_policy = slow_consumer_policy
+        self.dropped_messages = 0
+        self.evicted_connections = 0
+        # backend انتشار پیام بین workerها؛ هر worker فقط به سوکت‌های محلی خود ارسال می‌کند
+        self.backend = backend or InMemoryBroadcastBackend()
+
+    async def start(self):
+        await self.backend.start(self._deliver_local)
+
+    async def stop(self):
+        await self.backend.stop()
 
     async def connect(self, websocket: WebSocket, device_id: str):
         await websocket.accept()
-        if device_id not in self.active_connections:
-            self.active_connections[device_id] = []
-        self.active_connections[device_id].append(websocket)
+        subscriber = _Subscriber(websocket, device_id, self.queue_size)
+        subscriber.writer = asyncio.create_task(self._writer(subscriber))
+        self.active_connections.setdefault(device_id, {})[websocket] = subscriber
 
     def disconnect(self, websocket: WebSocket, device_id: str):
-        if device_id in self.active_connections:
-            self.active_connections[device_id].remove(websocket)
-            if not self.active_connections[device_id]:
-                del self.active_connections[device_id]
+        connections = self.active_connections.get(device_id)
+        if not connections:
+            return
+        subscriber = connections.pop(websocket, None)
+        if not connections:
+            del self.active_connections[device_id]
+        if subscriber and subscriber.writer and subscriber.writer is not asyncio.current_task():
+            subscriber.writer.cancel()
 
     async def broadcast_to_device(self, device_id: str, message: str):
-        if device_id in self.active_connections:
-            for connection in self.active_connections[device_id]:
-                await connection.send_text(message)
+        """
+        پیام را از طریق backend به تمام workerها منتشر می‌کند؛ هر worker آن را به
+        سوکت‌های محلی همان دستگاه تحویل می‌دهد.
+        """
+        await self.backend.publish(device_id, message)
+
+    def _deliver_local(self, device_id: str, message: str):
+        """
+        پیام را در صف ارسال تمام اتصال‌های محلی دستگاه قرار می‌دهد و منتظر ارسال نمی‌ماند.
+        هر اتصال task نویسنده‌ی خود را دارد، پس یک کلاینت کند بقیه را معطل نمی‌کند.
+        """
+        for subscriber in list(self.active_connections.get(device_id, {}).values()):
+            self._enqueue(subscriber, message)
+
+    def _enqueue(self, subscriber: _Subscriber, message: str):
+        try:
+            subscriber.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        # صف این کلاینت پر است؛ طبق سیاست تنظیم شده رفتار می‌کنیم
+        if self.slow_consumer_policy == "disconnect":
+            self._evict(subscriber)
+        elif self.slow_consumer_policy == "drop_oldest":
+            subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(message)
+            self.dropped_messages += 1
+        else:
+            self.dropped_messages += 1
+
+    async def _writer(self, subscriber: _Subscriber):
+        try:
+            while True:
+                message = await subscriber.queue.get()
+                await asyncio.wait_for(subscriber.websocket.send_text(message), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # اتصال قطع شده یا بیش از حد کند است؛ آن را کنار می‌گذاریم
+            self._evict(subscriber)
+
+    def _evict(self, subscriber: _Subscriber):
+        self.evicted_connections += 1
+        self.disconnect(subscriber.websocket, subscriber.device_id)
+        asyncio.create_task(self._close(subscriber.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "devices": len(self.active_connections),
+            "connections": sum(len(connections) for connections in self.active_connections.values()),
+            "dropped_messages": self.dropped_messages,
+            "evicted_connections": self.evicted_connections,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "backend": type(self.backend).__name__,
+        }
 
 # یک نمونه از مدیر ارتباطات می‌سازیم تا در کل برنامه قابل استفاده باشد
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager(backend=create_broadcast_backend())
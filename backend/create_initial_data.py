@@ -1,8 +1,7 @@
 # create_initial_data.py
 
 from app.database import SessionLocal, engine
-from app.models import Base
-from app import crud, schemas
+from app import crud, partitions, schemas
 
 def setup_initial_data():
     # یک session جدید برای ارتباط با دیتابیس ایجاد کن
@@ -68,8 +67,8 @@ def setup_initial_data():
 
 if __name__ == "__main__":
     print("Initializing database...")
-    # ابتدا مطمئن شو جداول ساخته شده‌اند
-    Base.metadata.create_all(bind=engine)
+    # ابتدا مطمئن شو جداول، ایندکس‌ها و پارتیشن‌ها ساخته شده‌اند
+    partitions.setup_schema(engine)
     print("Database tables created or already exist.")
     
     # سپس داده‌های اولیه را وارد کن
@@ -0,0 +1,274 @@
+# genieacs_simulator.py
+# شبیه‌ساز محلی GenieACS (NBI) با ناوگان مصنوعی برای توسعه و تست بار
+#
+# اجرا:
+#   python genieacs_simulator.py --devices 50000 --port 7557 --latency-ms 50 --error-rate 0.01
+# سپس در .env مقدار ACSSERVER_URL = http://localhost:7557 قرار دهید.
+
+import argparse
+import asyncio
+import copy
+import json
+import random
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+
+TEMPLATE_PATH = Path(__file__).parent / "modem1.json"
+
+WAN_IP_PATH = "InternetGatewayDevice.WANDevice.1.WANConnectionDevice.1.WANIPConnection.1.ExternalIPAddress"
+PPPOE_USER_PATH = "InternetGatewayDevice.WANDevice.1.WANConnectionDevice.1.WANPPPConnection.1.Username"
+SOFTWARE_VERSION_PATH = "InternetGatewayDevice.DeviceInfo.SoftwareVersion"
+
+PRODUCT_CLASSES = ["EG8145V5", "HG8245H", "HG8546M", "F670L"]
+SOFTWARE_VERSIONS = ["V5R019C00S100", "V5R019C10S115", "V5R020C00S050", "V3R017C10S120"]
+
+
+# --- کار با مسیرهای پارامتر در سند دستگاه ---
+
+def _get_node(doc: Dict[str, Any], path: str) -> Any:
+    node: Any = doc
+    for part in path.split("."):
+        if not isinstance(node, dict) or part not in node:
+            return None
+        node = node[part]
+    return node
+
+
+def _set_node(doc: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split(".")
+    node = doc
+    for part in parts[:-1]:
+        node = node.setdefault(part, {})
+    node[parts[-1]] = value
+
+
+def _flatten_values(node: Dict[str, Any], path: str = "") -> Dict[str, Any]:
+    """ مقدار ساده‌ی هر پارامتر و فیلدهای متای سطح بالا (_lastInform، _deviceId.*) را با مسیر کاملش برمی‌گرداند. """
+    values: Dict[str, Any] = {}
+    for key, child in node.items():
+        child_path = f"{path}.{key}" if path else key
+        if isinstance(child, dict):
+            if "_value" in child:
+                values[child_path] = child["_value"]
+            else:
+                values.update(_flatten_values(child, child_path))
+        elif path in ("", "_deviceId"):
+            values[child_path] = child
+    return values
+
+
+# --- ارزیابی زیرمجموعه‌ای از کوئری‌های MongoDB که GenieACS می‌پذیرد ---
+
+def _compare(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict) or not any(key.startswith("$") for key in condition):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "$eq" and not value == operand:
+            return False
+        if op == "$ne" and not value != operand:
+            return False
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if value is None:
+                return False
+            if op == "$gt" and not value > operand:
+                return False
+            if op == "$gte" and not value >= operand:
+                return False
+            if op == "$lt" and not value < operand:
+                return False
+            if op == "$lte" and not value <= operand:
+                return False
+        if op == "$in" and value not in operand:
+            return False
+        if op == "$nin" and value in operand:
+            return False
+        if op == "$exists" and (value is not None) != bool(operand):
+            return False
+        if op == "$regex" and (not isinstance(value, str) or not re.search(operand, value, re.I if "i" in condition.get("$options", "") else 0)):
+            return False
+    return True
+
+
+def _matches(lookup, query: Dict[str, Any]) -> bool:
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(_matches(lookup, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(lookup, sub) for sub in condition):
+                return False
+        elif not _compare(lookup(key), condition):
+            return False
+    return True
+
+
+class SimulatedFleet:
+    """
+    ناوگان مصنوعی: یک قالب مشترک (modem1.json) و برای هر دستگاه فقط مقادیر متفاوتش.
+    اسناد کامل فقط هنگام پاسخ‌گویی و فقط برای فیلدهای projection ساخته می‌شوند تا
+    حافظه برای ده‌ها هزار دستگاه کم بماند.
+    """
+
+    def __init__(self, count: int, seed: int = 42):
+        with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+            self.template: Dict[str, Any] = json.load(f)
+        self.template_values = _flatten_values(self.template)
+        oui = self.template["_deviceId"]["_OUI"]
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc)
+        self.devices: Dict[str, Dict[str, Any]] = {}
+        for index in range(count):
+            product_class = rng.choice(PRODUCT_CLASSES)
+            serial = f"48575443{index:08X}"
+            device_id = f"{oui}-{product_class}-{serial}"
+            registered = now - timedelta(days=rng.randint(1, 365))
+            # بیشتر دستگاه‌ها اخیراً inform کرده‌اند؛ بقیه آفلاین یا قدیمی هستند
+            last_inform = now - timedelta(seconds=rng.choice([rng.randint(0, 600), rng.randint(600, 86400), rng.randint(86400, 86400 * 30)]))
+            self.devices[device_id] = {
+                "_id": device_id,
+                "_deviceId._OUI": oui,
+                "_deviceId._ProductClass": product_class,
+                "_deviceId._SerialNumber": serial,
+                "_registered": registered.isoformat().replace("+00:00", "Z"),
+                "_lastInform": last_inform.isoformat().replace("+00:00", "Z"),
+                SOFTWARE_VERSION_PATH: rng.choice(SOFTWARE_VERSIONS),
+                WAN_IP_PATH: f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                PPPOE_USER_PATH: f"user{index:06d}@isp",
+            }
+        self.ids: List[str] = list(self.devices)
+
+    def value(self, device_id: str, path: str) -> Any:
+        overrides = self.devices[device_id]
+        if path in overrides:
+            return overrides[path]
+        return self.template_values.get(path)
+
+    def document(self, device_id: str, projection: Optional[List[str]]) -> Dict[str, Any]:
+        overrides = self.devices[device_id]
+        if projection is None:
+            doc = copy.deepcopy(self.template)
+            selected = list(overrides)
+        else:
+            doc = {}
+            for path in projection:
+                node = _get_node(self.template, path)
+                if node is not None:
+                    _set_node(doc, path, copy.deepcopy(node))
+            selected = [path for path in overrides if any(path == p or path.startswith(p + ".") for p in projection)]
+        for path in selected:
+            value = overrides[path]
+            if path.startswith("_"):
+                _set_node(doc, path, value)
+            else:
+                _set_node(doc, path, {"_value": value, "_type": "xsd:string", "_timestamp": overrides["_lastInform"], "_object": False})
+        doc["_id"] = device_id
+        return doc
+
+    def find(self, query: Dict[str, Any], sort: Dict[str, int]) -> List[str]:
+        ids = self.ids
+        if query:
+            ids = [device_id for device_id in ids if _matches(lambda path: self.value(device_id, path), query)]
+        for path, direction in reversed(list(sort.items())):
+            ids = sorted(ids, key=lambda device_id: (self.value(device_id, path) is None, self.value(device_id, path) or ""), reverse=direction < 0)
+        return ids
+
+
+def create_app(fleet: SimulatedFleet, latency_ms: float, jitter_ms: float, error_rate: float,
+               webhook_url: Optional[str], webhook_secret: str, task_delay: float, fault_rate: float) -> FastAPI:
+    app = FastAPI(title="GenieACS simulator")
+    tasks: Dict[str, Dict[str, Any]] = {}
+    http = httpx.AsyncClient()
+
+    @app.middleware("http")
+    async def inject_latency_and_errors(request: Request, call_next):
+        delay = max(0.0, random.gauss(latency_ms, jitter_ms)) / 1000 if latency_ms or jitter_ms else 0
+        if delay:
+            await asyncio.sleep(delay)
+        if error_rate and random.random() < error_rate:
+            return Response(status_code=503, content="Simulated failure")
+        return await call_next(request)
+
+    @app.get("/devices")
+    @app.get("/devices/")
+    async def list_devices(query: Optional[str] = None, projection: Optional[str] = None,
+                           skip: int = 0, limit: Optional[int] = None, sort: Optional[str] = None):
+        try:
+            parsed_query = json.loads(query) if query else {}
+            parsed_sort = json.loads(sort) if sort else {}
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON")
+        ids = fleet.find(parsed_query, parsed_sort)
+        ids = ids[skip:skip + limit] if limit is not None else ids[skip:]
+        fields = [path for path in projection.split(",") if path] if projection else None
+        return [fleet.document(device_id, fields) for device_id in ids]
+
+    async def _fire_webhook(device_id: str, task_id: str):
+        await asyncio.sleep(task_delay)
+        if task_id not in tasks:
+            return
+        tasks.pop(task_id)
+        payload: Dict[str, Any] = {"deviceId": device_id, "taskId": task_id}
+        if fault_rate and random.random() < fault_rate:
+            payload["fault"] = {"FaultCode": "9002", "FaultString": "Simulated internal error"}
+        if webhook_url:
+            try:
+                await http.post(webhook_url, json=payload, headers={"x-webhook-secret": webhook_secret}, timeout=10.0)
+            except httpx.HTTPError as e:
+                print(f"webhook to {webhook_url} failed: {e}")
+
+    @app.post("/devices/{device_id}/tasks", status_code=202)
+    async def create_task(device_id: str, task: Dict[str, Any]):
+        if device_id not in fleet.devices:
+            raise HTTPException(status_code=404, detail="No such device")
+        task_id = uuid.uuid4().hex[:24]
+        record = {**task, "_id": task_id, "device": device_id, "timestamp": datetime.now(timezone.utc).isoformat()}
+        tasks[task_id] = record
+        asyncio.create_task(_fire_webhook(device_id, task_id))
+        return record
+
+    @app.delete("/tasks/{task_id}")
+    @app.delete("/devices/{device_id}/tasks/{task_id}")
+    async def delete_task(task_id: str, device_id: Optional[str] = None):
+        if tasks.pop(task_id, None) is None:
+            raise HTTPException(status_code=404, detail="No such task")
+        return Response(status_code=200)
+
+    @app.on_event("shutdown")
+    async def close_http():
+        await http.aclose()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="شبیه‌ساز محلی GenieACS با ناوگان مصنوعی")
+    parser.add_argument("--devices", type=int, default=1000, help="تعداد دستگاه‌های مصنوعی")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7557)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="میانگین تأخیر هر پاسخ")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="انحراف معیار تأخیر")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="نسبت پاسخ‌های 503 (0 تا 1)")
+    parser.add_argument("--webhook-url", default="http://127.0.0.1:8000/acs/webhook/task-result",
+                        help="آدرس وب‌هوک نتیجه‌ی تسک؛ رشته‌ی خالی یعنی ارسال نشود")
+    parser.add_argument("--webhook-secret", default="YOUR_VERY_SECRET_KEY")
+    parser.add_argument("--task-delay", type=float, default=2.0, help="فاصله‌ی ایجاد تسک تا ارسال نتیجه (ثانیه)")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="نسبت تسک‌هایی که با fault تمام می‌شوند")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"Generating {args.devices} simulated devices...")
+    fleet = SimulatedFleet(args.devices, seed=args.seed)
+    app = create_app(fleet, args.latency_ms, args.jitter_ms, args.error_rate,
+                     args.webhook_url or None, args.webhook_secret, args.task_delay, args.fault_rate)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
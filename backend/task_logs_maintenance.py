@@ -0,0 +1,48 @@
+# task_logs_maintenance.py
+
+import argparse
+
+from app.database import engine
+from app import partitions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ساخت schema و نگهداری پارتیشن‌های ماهانه‌ی جدول task_logs")
+    parser.add_argument(
+        "command",
+        choices=["setup", "migrate", "ensure", "archive"],
+        help="setup: ساخت جداول، ایندکس‌ها و پارتیشن‌ها (پیش از هر استقرار) | migrate: تبدیل جدول قدیمی به پارتیشن‌بندی شده"
+             " | ensure: ساخت پارتیشن‌های آینده | archive: بایگانی پارتیشن‌های قدیمی"
+    )
+    parser.add_argument("--retention-months", type=int, default=partitions.settings.TASK_LOG_RETENTION_MONTHS)
+    parser.add_argument("--archive-dir", default=partitions.settings.TASK_LOG_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    # همان قفلی که workerهای برنامه برای نگهداری دوره‌ای می‌گیرند
+    with partitions.maintenance_lock(engine) as acquired:
+        if not acquired:
+            raise SystemExit("Another task_logs maintenance run is in progress; try again later.")
+        run_command(args)
+
+
+def run_command(args):
+    if args.command == "setup":
+        print("Creating tables, indexes and partitions...")
+        partitions.setup_schema(engine)
+        print("Done.")
+    elif args.command == "migrate":
+        print("Converting task_logs to a monthly partitioned table...")
+        partitions.migrate_to_partitioned(engine)
+        print("Done.")
+    elif args.command == "ensure":
+        partitions.ensure_partitions(engine)
+        print("Partitions:", ", ".join(partitions.list_partitions(engine)))
+    else:
+        archived = partitions.archive_old_partitions(engine, args.retention_months, args.archive_dir)
+        for path in archived:
+            print(f"  - archived {path}")
+        print(f"{len(archived)} partition(s) archived.")
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,7 @@ const TaskHistory = ({ deviceId, refreshKey }) => {
     const [tasks, setTasks] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
+    const [nextCursor, setNextCursor] = useState(null);
 
     // آدرس WebSocket را می‌سازیم (پروتکل ws یا wss)
     const socketUrl = `ws://localhost:8000/ws/device-status/${deviceId}`;
@@ -84,7 +85,8 @@ const handleDeleteTask = async (taskId) => {
             setError('');
             try {
                 const response = await apiClient.get(`/acs/devices/${deviceId}/tasks`);
-                setTasks(response.data);
+                setTasks(response.data.items);
+                setNextCursor(response.data.next_cursor);
             } catch (err) {
                 setError('خطا در دریافت تاریخچه عملیات.');
                 console.error(err);
@@ -96,6 +98,18 @@ const handleDeleteTask = async (taskId) => {
         fetchTasks();
     }, [deviceId, refreshKey]); // با تغییر refreshKey، این تابع مجددا اجرا می‌شود
 
+    // دریافت صفحه‌ی بعدی تاریخچه با cursor
+    const loadMore = async () => {
+        try {
+            const response = await apiClient.get(`/acs/devices/${deviceId}/tasks`, { params: { cursor: nextCursor } });
+            setTasks(prevTasks => [...prevTasks, ...response.data.items]);
+            setNextCursor(response.data.next_cursor);
+        } catch (err) {
+            setError('خطا در دریافت تاریخچه عملیات.');
+            console.error(err);
+        }
+    };
+
     if (loading) return <p className="text-sm text-center p-4">در حال بارگذاری تاریخچه...</p>;
     if (error) return <p className="text-sm text-red-600 text-center p-4">{error}</p>;
 
@@ -134,6 +148,11 @@ const handleDeleteTask = async (taskId) => {
                             ))}
                         </tbody>
                     </table>
+                    {nextCursor && (
+                        <button onClick={loadMore} className="w-full mt-2 p-1 text-sm text-emerald-700 hover:bg-emerald-50 rounded-md cursor-pointer">
+                            نمایش موارد قدیمی‌تر
+                        </button>
+                    )}
                 </div>
             )}
         </div>
@@ -26,6 +26,9 @@ const handleChangeWifiPassword = async () => {
         return;
     }
 
+    // هر رمز وارد شده در این پنجره یک کلید ثابت دارد تا ارسال مجدد، تسک تکراری نسازد
+    const idempotencyKeys = {};
+
     const { value: newPassword } = await MySwal.fire({
         title: 'تغییر رمز وای‌فای',
         input: 'text',
@@ -45,9 +48,12 @@ const handleChangeWifiPassword = async () => {
         showLoaderOnConfirm: true,
         preConfirm: async (value) => {
             try {
+                idempotencyKeys[value] ??= crypto.randomUUID();
                 const response = await apiClient.post('/acs/tasks/change-wifi-password', {
                     deviceId: device._id,
                     newPassword: value,
+                }, {
+                    headers: { 'Idempotency-Key': idempotencyKeys[value] },
                 });
                 return response.data;
             } catch (error) {
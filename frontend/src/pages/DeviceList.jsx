@@ -6,12 +6,25 @@ import { getVal, getHostnameFromUrl, formatTimeAgo, isOnline, isoTimeToJalali }
 import { Globe, CirclePower } from 'lucide-react';
 
 
+// فقط ستون‌هایی که در جدول نمایش داده می‌شوند از GenieACS خوانده می‌شوند
+const LIST_PROJECTION = [
+    '_id',
+    '_deviceId',
+    '_lastInform',
+    '_registered',
+    'InternetGatewayDevice.ManagementServer.ConnectionRequestURL',
+    'InternetGatewayDevice.WANDevice.1.WANConnectionDevice.1.WANIPConnection.1.MACAddress',
+    'InternetGatewayDevice.WANDevice.1.WANConnectionDevice.1.WANIPConnection.1.ExternalIPAddress',
+].join(',');
+const PAGE_SIZE = 50;
+
 const DeviceList = ({ deviceId, refreshKey, onDeviceSelect }) => { 
     console.log(`%c[DeviceList] Rendered. deviceId: ${deviceId}, refreshKey: ${refreshKey}`, "color: orange; font-weight: bold;");
 
     const [devices, setDevices] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
+    const [page, setPage] = useState(0);
 
     useEffect(() => {
         const fetchData = async () => {
@@ -20,7 +33,13 @@ const DeviceList = ({ deviceId, refreshKey, onDeviceSelect }) => {
             try {
                 // اگر deviceId نیست، کل لیست مودم‌ها را بگیر
                 console.log("[DeviceList] Fetching all devices: /acs/devices/");
-                const response = await apiClient.get('/acs/devices/');
+                const response = await apiClient.get('/acs/devices/', {
+                    params: {
+                        projection: LIST_PROJECTION,
+                        skip: page * PAGE_SIZE,
+                        limit: PAGE_SIZE,
+                    },
+                });
                 if (Array.isArray(response.data)) {
                     setDevices(response.data);
                 } else {
@@ -36,7 +55,7 @@ const DeviceList = ({ deviceId, refreshKey, onDeviceSelect }) => {
         };
 
         fetchData();
-    }, [deviceId, refreshKey]);
+    }, [deviceId, refreshKey, page]);
 
     if (loading) return <p className="text-center p-4">در حال بارگذاری اطلاعات...</p>;
     if (error) return <p className="text-center p-4 text-red-600">خطا: {error}</p>;
@@ -47,7 +66,7 @@ const DeviceList = ({ deviceId, refreshKey, onDeviceSelect }) => {
     }
 
     // اگر deviceId نیست یعنی صفحه لیست مودم‌ها
-    if (!devices || devices.length === 0) return <p className="text-center p-4">هیچ مودمی یافت نشد.</p>;
+    if ((!devices || devices.length === 0) && page === 0) return <p className="text-center p-4">هیچ مودمی یافت نشد.</p>;
 
     const handleRowClick = (device) => {
         const deviceId = device?._id 
@@ -71,6 +90,7 @@ const DeviceList = ({ deviceId, refreshKey, onDeviceSelect }) => {
     };
     
     return (
+        <>
         <table className="min-w-full divide-y divide-gray-200">
             <thead className="bg-gray-50 text-right text-xs font-medium text-gray-500">
                 <tr>
@@ -121,6 +141,12 @@ const DeviceList = ({ deviceId, refreshKey, onDeviceSelect }) => {
                 })}
             </tbody>
         </table>
+        <div className="flex justify-center items-center gap-2 p-3 text-sm">
+            <button className="px-3 py-1 rounded-md border border-gray-300 disabled:opacity-50" disabled={page === 0} onClick={() => setPage(page - 1)}>قبلی</button>
+            <span>صفحه {page + 1}</span>
+            <button className="px-3 py-1 rounded-md border border-gray-300 disabled:opacity-50" disabled={devices.length < PAGE_SIZE} onClick={() => setPage(page + 1)}>بعدی</button>
+        </div>
+        </>
     );
 };
 